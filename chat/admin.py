@@ -1,12 +1,61 @@
 # chat/admin.py
 
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import Sum
+from django.utils.functional import cached_property
 
-from .models import Prompt, Credits, NebiusModel, OobaboogaCharacter, Profile, OllamaModel, OpenAIModel
+from .models import (Prompt, Credits, NebiusModel, OobaboogaCharacter, Profile, OllamaModel, OpenAIModel,
+                     Conversation, Message, MessageReaction, UsageRollup)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs a full COUNT(*) on a large table.
+
+    Unfiltered lists use the planner's row estimate on PostgreSQL and the
+    highest rowid on SQLite. Filtered lists count at most ADMIN_COUNT_LIMIT rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self._estimate(queryset.model)
+            if estimate is not None:
+                return estimate
+        return queryset.values('pk')[:settings.ADMIN_COUNT_LIMIT].count()
+
+    def _estimate(self, model):
+        connection = connections[router.db_for_read(model)]
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+            else:
+                return None
+            row = cursor.fetchone()
+        if not row or row[0] is None or row[0] < 0:
+            return None
+        return int(row[0])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Base admin for tables with millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ('-id',)
 
 @admin.register(Credits)
-class CreditsAdmin(admin.ModelAdmin):
+class CreditsAdmin(LargeTableAdmin):
     list_display = ('user', 'credits')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     search_fields = ('user__username',)
 
 @admin.register(Prompt)
@@ -35,7 +84,87 @@ class OpenAIModelAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin):
     list_display = ('user', 'backend_api_choice', 'selected_model', 'selected_character', 'selected_ollama_model','selected_openai_model','otp_enabled')
     list_filter = ('backend_api_choice', 'otp_enabled')
-    search_fields = ('user__username',)
\ No newline at end of file
+    list_select_related = ('user', 'selected_model', 'selected_character', 'selected_ollama_model', 'selected_openai_model')
+    autocomplete_fields = ('user', 'selected_model', 'selected_character', 'selected_ollama_model', 'selected_openai_model')
+    search_fields = ('user__username',)
+
+@admin.register(Conversation)
+class ConversationAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'summary', 'created_at', 'archived')
+    list_select_related = ('user',)
+    list_filter = ('archived',)
+    autocomplete_fields = ('user',)
+    search_fields = ('=id', '=uuid', '=user__username')
+    readonly_fields = ('uuid', 'created_at')
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    list_display = ('id', 'conversation_id', 'sender', 'backend', 'model_name', 'routing', 'is_active', 'timestamp')
+    list_filter = ('sender', 'backend')
+    raw_id_fields = ('conversation', 'parent')
+    search_fields = ('=id', '=conversation__id')
+    readonly_fields = ('timestamp',)
+
+@admin.register(MessageReaction)
+class MessageReactionAdmin(LargeTableAdmin):
+    list_display = ('id', 'message_id', 'user', 'reaction', 'created_at')
+    list_select_related = ('user',)
+    list_filter = ('reaction',)
+    raw_id_fields = ('message',)
+    autocomplete_fields = ('user',)
+    search_fields = ('=message__id', '=user__username')
+    readonly_fields = ('created_at',)
+
+@admin.register(UsageRollup)
+class UsageRollupAdmin(LargeTableAdmin):
+    """
+    Read-only usage and quality dashboard, filled by the rollup_usage command.
+
+    Above the rows per user, backend and model, the changelist shows the
+    totals per day of the filtered rows.
+    """
+    list_display = ('date', 'user', 'backend', 'model_name', 'user_messages', 'bot_messages', 'failed_responses',
+                    'images', 'tokens', 'credits_spent', 'reactions_up', 'reactions_down', 'helpful_ratio')
+    list_select_related = ('user',)
+    list_filter = ('backend',)
+    search_fields = ('=user__username', 'model_name')
+    date_hierarchy = 'date'
+    ordering = ('-date', 'backend', 'model_name')
+    change_list_template = 'admin/chat/usagerollup/change_list.html'
+    daily_total_fields = ('user_messages', 'bot_messages', 'failed_responses', 'images', 'tokens', 'credits_spent',
+                          'reactions_up', 'reactions_down')
+
+    @admin.display(description='Helpful ratio')
+    def helpful_ratio(self, obj):
+        ratio = obj.reaction_ratio
+        return f'{ratio:.0%}' if ratio is not None else '-'
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        try:
+            queryset = response.context_data['cl'].queryset
+        except (AttributeError, KeyError):
+            # A redirect or an error page, nothing to summarize.
+            return response
+        days = (queryset.order_by().values('date')
+                .annotate(**{field: Sum(field) for field in self.daily_total_fields})
+                .order_by('-date')[:self.list_per_page])
+        daily_totals = []
+        for day in days:
+            reactions = day['reactions_up'] + day['reactions_down']
+            day['helpful_ratio'] = f"{day['reactions_up'] / reactions:.0%}" if reactions else '-'
+            daily_totals.append(day)
+        response.context_data['daily_totals'] = daily_totals
+        return response
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,255 @@
+# chat/archive.py
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import bump_version
+from .cleanup import raw_delete
+from .models import Conversation, Message, MessageReaction, ArchivedConversation
+from .replicas import pin_to_primary
+
+from datetime import timedelta
+import json
+import re
+import zlib
+
+__all__ = ['archive_conversation', 'archive_inactive_conversations', 'restore_conversation',
+           'load_archived_messages', 'search_archived_conversations', 'archived_conversation_of_message',
+           'index_archives']
+
+
+ARCHIVED_FIELDS = ('id', 'sender', 'text', 'image', 'timestamp', 'backend', 'model_name', 'routing', 'parent_id', 'is_active',
+                   'html', 'html_version')
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return zlib.compress(data, 9)
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+def _cache_key(conversation_id):
+    return f"archived_messages:{conversation_id}"
+
+def _search_fields(messages):
+    """The search tokens and message id bounds of an archive."""
+    tokens = set()
+    for msg in messages:
+        tokens.update(TOKEN_PATTERN.findall(msg['text'].lower()))
+    ids = [msg['id'] for msg in messages]
+    return {
+        'search_tokens': ' '.join(sorted(tokens)),
+        'min_message_id': min(ids, default=None),
+        'max_message_id': max(ids, default=None),
+    }
+
+def index_archives(batch_size=100):
+    """
+    Fills the search fields of archives written before they existed.
+
+    Run by the archive_conversations command, searches still find these
+    archives meanwhile by decompressing them.
+
+    Args:
+        batch_size (int): Archives decompressed per query.
+
+    Returns:
+        int: Number of archives indexed.
+    """
+    indexed = 0
+    while True:
+        archives = list(ArchivedConversation.objects.filter(search_tokens__isnull=True)
+                        .values_list('pk', 'codec', 'data')[:batch_size])
+        if not archives:
+            return indexed
+        for pk, codec, data in archives:
+            messages = json.loads(_decompress(bytes(data), codec))
+            ArchivedConversation.objects.filter(pk=pk).update(**_search_fields(messages))
+        indexed += len(archives)
+
+def archive_conversation(conversation):
+    """
+    Moves the messages of a conversation into a compressed archive row.
+
+    Args:
+        conversation (Conversation): The conversation to archive.
+
+    Returns:
+        ArchivedConversation or None: The archive, or None if there was nothing to archive.
+
+    Messages and their reactions are serialized with their original ids and
+    timestamps so restore_conversation can put them back unchanged.
+    """
+    with transaction.atomic():
+        messages = list(conversation.messages.order_by('timestamp', 'id').values(*ARCHIVED_FIELDS))
+        if not messages:
+            return None
+        message_ids = [msg['id'] for msg in messages]
+        reactions = {}
+        for message_id, user_id, reaction, created_at in MessageReaction.objects.filter(
+            message_id__in=message_ids
+        ).values_list('message_id', 'user_id', 'reaction', 'created_at'):
+            reactions.setdefault(message_id, []).append([user_id, reaction, created_at.isoformat()])
+        for msg in messages:
+            msg['timestamp'] = msg['timestamp'].isoformat()
+            msg['reactions'] = reactions.get(msg['id'], [])
+
+        codec = settings.ARCHIVE_CODEC
+        archive = ArchivedConversation.objects.create(
+            conversation=conversation,
+            codec=codec,
+            data=_compress(json.dumps(messages, separators=(',', ':')).encode(), codec),
+            message_count=len(messages),
+            image_names='\n'.join(msg['image'] for msg in messages if msg['image']),
+            **_search_fields(messages),
+        )
+        raw_delete(MessageReaction.objects.filter(message_id__in=message_ids))
+        raw_delete(Message.objects.filter(id__in=message_ids))
+        Conversation.objects.filter(id=conversation.id).update(archived=True)
+    bump_version('conversation', conversation.id)
+    return archive
+
+def archive_inactive_conversations(days=None, limit=None):
+    """
+    Archives every conversation without new messages for the given number of days.
+
+    Args:
+        days (int, optional): Inactivity threshold, ARCHIVE_AFTER_DAYS by default.
+        limit (int, optional): Maximum number of conversations to archive in this run.
+
+    Returns:
+        int: Number of conversations archived.
+    """
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    candidates = Conversation.objects.filter(archived=False).annotate(
+        last_activity=Max('messages__timestamp')
+    ).filter(last_activity__lt=cutoff).order_by('id')
+    if limit:
+        candidates = candidates[:limit]
+
+    archived = 0
+    for conversation in candidates.iterator():
+        if archive_conversation(conversation):
+            archived += 1
+    return archived
+
+def load_archived_messages(conversation_id):
+    """
+    Returns the messages of an archived conversation, decompressed once and cached.
+
+    Args:
+        conversation_id (int): The archived conversation.
+
+    Returns:
+        list: Message dicts with id, sender, text, image, timestamp and reactions.
+    """
+    messages = cache.get(_cache_key(conversation_id))
+    if messages is None:
+        archive = ArchivedConversation.objects.filter(conversation_id=conversation_id).first()
+        if archive is None:
+            return []
+        messages = json.loads(_decompress(bytes(archive.data), archive.codec))
+        for msg in messages:
+            msg['timestamp'] = parse_datetime(msg['timestamp'])
+            msg['image_url'] = default_storage.url(msg['image']) if msg['image'] else None
+        cache.set(_cache_key(conversation_id), messages, settings.ARCHIVE_CACHE_TIMEOUT)
+    return messages
+
+def restore_conversation(conversation):
+    """
+    Moves an archived conversation back into the message table.
+
+    The user is pinned to the primary database first, so the archive is read
+    from there and the restored messages are visible on the next reads.
+
+    Args:
+        conversation (Conversation): The archived conversation.
+    """
+    pin_to_primary(conversation.user_id)
+    if not Conversation.objects.filter(id=conversation.id, archived=True).exists():
+        # Already restored, the caller's copy came from a lagging replica.
+        conversation.archived = False
+        return
+    messages = load_archived_messages(conversation.id)
+    with transaction.atomic():
+        Message.objects.bulk_create([
+            Message(conversation_id=conversation.id, **{
+                field: msg[field] for field in ARCHIVED_FIELDS if field in msg
+            })
+            for msg in messages
+        ])
+        MessageReaction.objects.bulk_create([
+            MessageReaction(message_id=msg['id'], user_id=user_id, reaction=reaction,
+                            created_at=parse_datetime(created_at))
+            for msg in messages for user_id, reaction, created_at in msg['reactions']
+        ])
+        raw_delete(ArchivedConversation.objects.filter(conversation_id=conversation.id))
+        Conversation.objects.filter(id=conversation.id).update(archived=False)
+    conversation.archived = False
+    cache.delete(_cache_key(conversation.id))
+    bump_version('conversation', conversation.id)
+
+def search_archived_conversations(user, query, exclude_ids=()):
+    """
+    Substring search over the archived conversations of a user.
+
+    Archives are narrowed down in the database by the words of the query:
+    each word of a matching message contains a query word, so only archives
+    whose search_tokens contain all of them are decompressed.
+
+    Args:
+        user (User): The owner of the conversations.
+        query (str): The text to look for.
+        exclude_ids (iterable): Conversations already matched by the database search.
+
+    Returns:
+        list: (conversation, matching message dicts) pairs.
+    """
+    query = query.lower()
+    conversations = Conversation.objects.filter(user=user, archived=True).exclude(id__in=exclude_ids).order_by('-created_at')
+    words = TOKEN_PATTERN.findall(query)
+    if words:
+        indexed = Q()
+        for word in words:
+            indexed &= Q(archive__search_tokens__contains=word)
+        conversations = conversations.filter(Q(archive__search_tokens__isnull=True) | indexed)
+    results = []
+    for conversation in conversations:
+        matching = [msg for msg in load_archived_messages(conversation.id) if query in msg['text'].lower()]
+        if matching:
+            results.append((conversation, matching))
+    return results
+
+def archived_conversation_of_message(user, message_id):
+    """
+    Finds the archived conversation of a user that holds a message.
+
+    Args:
+        user (User): The owner of the conversation.
+        message_id (int): The message.
+
+    Returns:
+        Conversation or None: The archived conversation, None if no archive holds the message.
+    """
+    conversations = Conversation.objects.filter(
+        Q(archive__min_message_id__isnull=True) | Q(archive__min_message_id__lte=message_id, archive__max_message_id__gte=message_id),
+        user=user, archived=True,
+    )
+    for conversation in conversations:
+        if any(msg['id'] == message_id for msg in load_archived_messages(conversation.id)):
+            return conversation
+    return None
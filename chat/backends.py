@@ -0,0 +1,35 @@
+# chat/backends.py
+
+from .warmup import ollama_base_url
+
+import os
+
+__all__ = ['OPENAI_COMPATIBLE_BACKENDS', 'openai_client']
+
+OPENAI_COMPATIBLE_BACKENDS = {
+    'openai': ("https://api.openai.com/v1/", "OPENAI_API_KEY"),
+    'ollama': (f"{ollama_base_url()}/v1", None),
+    'nebius': ("https://api.studio.nebius.ai/v1/", "NEBIUS_API_KEY"),
+}
+
+
+def openai_client(backend_api):
+    """
+    Creates an OpenAI client for an OpenAI-compatible backend.
+
+    The openai package is the slowest import of the project, so it is loaded
+    on the first call instead of when a worker or management command starts.
+    Every call gets its own client, since a BackendCall closes its client to
+    cancel the request.
+
+    Args:
+        backend_api (str): A key of OPENAI_COMPATIBLE_BACKENDS.
+
+    Returns:
+        OpenAI: The client.
+    """
+    from openai import OpenAI
+
+    url, api_key_name = OPENAI_COMPATIBLE_BACKENDS[backend_api]
+    api_key = os.getenv(api_key_name) if api_key_name else backend_api
+    return OpenAI(base_url=url, api_key=api_key)
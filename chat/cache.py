@@ -0,0 +1,74 @@
+# chat/cache.py
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .replicas import read_from_primary
+
+import time
+
+__all__ = ['get_version', 'bump_version', 'cached']
+
+
+def _version_key(namespace, owner_id):
+    return f"version:{namespace}:{owner_id}"
+
+def get_version(namespace, owner_id=None):
+    """
+    Returns the current version of a cached namespace.
+
+    Args:
+        namespace (str): The kind of data, e.g. 'conversations' or 'prompts'.
+        owner_id (int, optional): The user the data belongs to, None for global data.
+
+    Returns:
+        int: The version number, part of every key cached under the namespace.
+
+    Missing versions start from the current time rather than from 1, so a version
+    lost to eviction or a cache restart never comes back to a value that was
+    already used for stale data.
+    """
+    key = _version_key(namespace, owner_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+def bump_version(namespace, owner_id=None):
+    """
+    Invalidates everything cached under a namespace by moving to a new version.
+
+    Args:
+        namespace (str): The kind of data, e.g. 'conversations' or 'prompts'.
+        owner_id (int, optional): The user the data belongs to, None for global data.
+    """
+    key = _version_key(namespace, owner_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+def cached(namespace, owner_id, loader, timeout=None):
+    """
+    Cache-aside lookup of versioned data.
+
+    Args:
+        namespace (str): The kind of data, e.g. 'conversations' or 'prompts'.
+        owner_id (int or None): The user the data belongs to, None for global data.
+        loader (callable): Builds the value from the database on a cache miss.
+        timeout (int, optional): Lifetime in seconds, USER_DATA_CACHE_TIMEOUT by default.
+
+    Returns:
+        The cached or freshly loaded value.
+    """
+    if timeout is None:
+        timeout = settings.USER_DATA_CACHE_TIMEOUT
+    key = f"{namespace}:{owner_id}:{get_version(namespace, owner_id)}"
+    value = cache.get(key)
+    if value is None:
+        # From the primary, a stale replica read would stay cached until the next version bump.
+        with read_from_primary():
+            value = loader()
+        cache.set(key, value, timeout)
+    return value
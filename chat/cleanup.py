@@ -0,0 +1,173 @@
+# chat/cleanup.py
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import transaction, router
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import Conversation, Message, MessageReaction, ArchivedConversation, ReactionEvent, ImageCacheEntry
+from .semantic import compact_index, drop_index
+
+from datetime import timedelta
+
+__all__ = ['raw_delete', 'delete_conversations', 'delete_user', 'referenced_media', 'delete_unreferenced_media', 'collect_orphaned_media']
+
+GENERATED_IMAGES_DIR = 'generated_images'
+ARCHIVE_LOOKUP_CHUNK = 200
+
+
+def raw_delete(queryset):
+    """Deletes the rows of a queryset with a single DELETE, without loading them or sending signals."""
+    return queryset._raw_delete(router.db_for_write(queryset.model))
+
+def delete_conversations(user_id, conversation_ids=None, batch_size=None, max_id=None):
+    """
+    Deletes conversations of a user in bounded batches.
+
+    Args:
+        user_id (int): The owner of the conversations.
+        conversation_ids (list, optional): Only delete these conversations, all of them by default.
+        batch_size (int, optional): Rows per transaction, DELETE_BATCH_SIZE by default.
+        max_id (int, optional): Only delete conversations up to this id, so ones started after
+            the deletion was requested are kept.
+
+    Returns:
+        int: Number of conversations deleted.
+
+    Reactions, messages and conversations are removed with raw DELETE statements,
+    one short transaction per batch, so writers are never blocked for long. Images
+    of the deleted messages are removed once nothing references them any more.
+    """
+    batch_size = batch_size or settings.DELETE_BATCH_SIZE
+    conversations = Conversation.objects.filter(user_id=user_id)
+    if conversation_ids is not None:
+        conversations = conversations.filter(id__in=conversation_ids)
+    if max_id is not None:
+        conversations = conversations.filter(id__lte=max_id)
+
+    deleted = 0
+    while True:
+        batch = list(conversations.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not batch:
+            break
+        image_names = []
+        while True:
+            with transaction.atomic():
+                rows = list(Message.objects.filter(conversation_id__in=batch).order_by('-id').values_list('id', 'image')[:batch_size])
+                if not rows:
+                    break
+                # Newest first, so regenerated variants go before the user message they answer.
+                message_ids = [message_id for message_id, _ in rows]
+                raw_delete(MessageReaction.objects.filter(message_id__in=message_ids))
+                raw_delete(Message.objects.filter(id__in=message_ids))
+            image_names.extend(name for _, name in rows if name)
+        with transaction.atomic():
+            for names in ArchivedConversation.objects.filter(conversation_id__in=batch).values_list('image_names', flat=True):
+                image_names.extend(names.split())
+            raw_delete(ArchivedConversation.objects.filter(conversation_id__in=batch))
+            raw_delete(Conversation.objects.filter(id__in=batch))
+        for conversation_id in batch:
+            bump_version('conversation', conversation_id)
+        bump_version('conversations', user_id)
+        delete_unreferenced_media(image_names)
+        deleted += len(batch)
+    if conversation_ids is None and max_id is None:
+        drop_index(user_id)
+    elif deleted:
+        compact_index(user_id)
+    return deleted
+
+def delete_user(user_id):
+    """
+    Deletes a user account, removing its conversations in batches first.
+
+    Args:
+        user_id (int): The user to delete.
+    """
+    delete_conversations(user_id)
+    raw_delete(ReactionEvent.objects.filter(user_id=user_id))
+    User.objects.filter(id=user_id).delete()
+
+def referenced_media(names):
+    """
+    Returns which of the given image names are still in use.
+
+    Args:
+        names (iterable): Storage names of image files.
+
+    Returns:
+        set: The names referenced by a message, an archived conversation or the image cache.
+    """
+    names = set(names)
+    referenced = set(Message.objects.filter(image__in=names).values_list('image', flat=True))
+    referenced.update(ImageCacheEntry.objects.filter(image__in=names - referenced).values_list('image', flat=True))
+    remaining = sorted(names - referenced)
+    # One scan of the archives per chunk instead of one per name. Chunks keep the
+    # OR chain below SQLite's expression depth limit.
+    for start in range(0, len(remaining), ARCHIVE_LOOKUP_CHUNK):
+        chunk = remaining[start:start + ARCHIVE_LOOKUP_CHUNK]
+        matches = Q()
+        for name in chunk:
+            matches |= Q(image_names__contains=name)
+        for image_names in ArchivedConversation.objects.filter(matches).values_list('image_names', flat=True):
+            referenced.update(set(image_names.split('\n')).intersection(chunk))
+    return referenced
+
+def delete_unreferenced_media(names):
+    """
+    Removes image files that nothing refers to any more.
+
+    Args:
+        names (iterable): Storage names of candidate files.
+
+    Returns:
+        int: Number of files removed.
+    """
+    names = set(names)
+    if not names:
+        return 0
+    referenced = referenced_media(names)
+    removed = 0
+    for name in names - referenced:
+        try:
+            default_storage.delete(name)
+            removed += 1
+        except OSError as e:
+            print(f"Error deleting media file {name}: {e}")
+    return removed
+
+def collect_orphaned_media(grace_period=None, dry_run=False, batch_size=None):
+    """
+    Garbage-collects generated images that no message refers to.
+
+    Args:
+        grace_period (int, optional): Minimum file age in seconds, MEDIA_GC_GRACE_PERIOD by default.
+            Younger files may belong to a message that is still being saved.
+        dry_run (bool): Only report the orphaned files.
+        batch_size (int, optional): File names checked per query, DELETE_BATCH_SIZE by default.
+
+    Returns:
+        list: Storage names of the orphaned files.
+    """
+    grace_period = settings.MEDIA_GC_GRACE_PERIOD if grace_period is None else grace_period
+    batch_size = batch_size or settings.DELETE_BATCH_SIZE
+    if not default_storage.exists(GENERATED_IMAGES_DIR):
+        return []
+    cutoff = timezone.now() - timedelta(seconds=grace_period)
+    _, files = default_storage.listdir(GENERATED_IMAGES_DIR)
+    names = [f"{GENERATED_IMAGES_DIR}/{filename}" for filename in files]
+
+    orphaned = []
+    for start in range(0, len(names), batch_size):
+        batch = names[start:start + batch_size]
+        referenced = referenced_media(batch)
+        for name in batch:
+            if name not in referenced and default_storage.get_modified_time(name) < cutoff:
+                orphaned.append(name)
+    if not dry_run:
+        for name in orphaned:
+            default_storage.delete(name)
+    return orphaned
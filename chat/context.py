@@ -0,0 +1,83 @@
+# chat/context.py
+
+from django.db.models import F, OuterRef, Subquery
+
+from .models import Credits, Profile
+
+__all__ = ['UserContext', 'load_user_context']
+
+
+class UserContext:
+    """
+    The profile, selected models and credit balance of the requesting user.
+
+    Loaded once per request by UserContextMiddleware and passed to the backend
+    functions, so a chat turn does not look up the same user over and over.
+    """
+
+    def __init__(self, user, profile, credits):
+        self.user = user
+        self.profile = profile
+        self.credits = credits
+
+    @property
+    def backend_api(self):
+        return self.profile.backend_api_choice
+
+    @property
+    def fallback_backends(self):
+        return self.profile.fallback_backend_list
+
+    @property
+    def hedge_requests(self):
+        return self.profile.hedge_requests
+
+    def selected_model(self, backend_api):
+        """
+        Returns the model (or character) the user selected for a backend.
+
+        Args:
+            backend_api (str): The backend API.
+
+        Returns:
+            str or None: The model name, None if nothing is selected.
+        """
+        selected = {
+            'openai': self.profile.selected_openai_model,
+            'ollama': self.profile.selected_ollama_model,
+            'nebius': self.profile.selected_model,
+            'oobabooga': self.profile.selected_character,
+        }.get(backend_api)
+        return selected.name if selected else None
+
+    def charge(self, amount):
+        """
+        Takes credits from the user with an UPDATE, so concurrent requests cannot overwrite each other.
+
+        Args:
+            amount (int): The number of credits to take.
+        """
+        Credits.objects.filter(user_id=self.user.id).update(credits=F('credits') - amount)
+        self.credits -= amount
+
+
+def load_user_context(user):
+    """
+    Loads the profile, its four selected-model FKs and the credits of a user in one query.
+
+    Args:
+        user (User): An authenticated user.
+
+    Returns:
+        UserContext: The user's context.
+    """
+    profile = Profile.objects.select_related(
+        'selected_model', 'selected_character', 'selected_ollama_model', 'selected_openai_model'
+    ).defer('otp_secret_key').annotate(
+        credits_balance=Subquery(Credits.objects.filter(user_id=OuterRef('user_id')).values('credits')[:1])
+    ).get(user=user)
+    profile.user = user
+    if profile.credits_balance is None:
+        # Accounts created before signup started creating credits.
+        profile.credits_balance = Credits.objects.create(user=user, credits=500).credits
+    return UserContext(user, profile, profile.credits_balance)
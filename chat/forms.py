@@ -2,17 +2,26 @@
 
 from django import forms
 from django.contrib.auth.forms import PasswordChangeForm, AuthenticationForm
-from django.contrib.auth import authenticate
 
 from .models import Profile, NebiusModel, OobaboogaCharacter, OllamaModel, OpenAIModel
 
-import pyotp
-
 
 class BackendAPIChoiceForm(forms.ModelForm):
+    fallback_backends = forms.MultipleChoiceField(
+        choices=Profile.BACKEND_API_CHOICES,
+        required=False,
+        label='Fallback backends when the selected one is slow or offline',
+        widget=forms.CheckboxSelectMultiple(attrs={
+            'class': 'mr-2 rounded bg-gray-800 border-gray-700 focus:ring focus:ring-blue-500',
+        }),
+    )
+
     class Meta:
         model = Profile
-        fields = ['backend_api_choice', 'selected_model', 'selected_character', 'selected_ollama_model', 'selected_openai_model']
+        fields = ['backend_api_choice', 'selected_model', 'selected_character', 'selected_ollama_model', 'selected_openai_model', 'hedge_requests', 'fallback_backends']
+        labels = {
+            'hedge_requests': 'Hedge slow requests with an equivalent backend',
+        }
         widgets = {
             'backend_api_choice': forms.Select(attrs={
                 'class': 'w-full px-3 py-2 bg-gray-800 border border-gray-700 rounded-lg focus:outline-none focus:ring focus:ring-blue-500',
@@ -29,11 +38,27 @@ class BackendAPIChoiceForm(forms.ModelForm):
             'selected_openai_model': forms.Select(attrs={
                 'class': 'w-full px-3 py-2 bg-gray-800 border border-gray-700 rounded-lg focus:outline-none focus:ring focus:ring-blue-500',
             }),
+            'hedge_requests': forms.CheckboxInput(attrs={
+                'class': 'mr-2 rounded bg-gray-800 border-gray-700 focus:ring focus:ring-blue-500',
+            }),
         }
 
+    # The model (or character) field of each backend.
+    BACKEND_FIELDS = {
+        'nebius': 'selected_model',
+        'oobabooga': 'selected_character',
+        'ollama': 'selected_ollama_model',
+        'openai': 'selected_openai_model',
+    }
+
     def __init__(self, *args, **kwargs):
         super(BackendAPIChoiceForm, self).__init__(*args, **kwargs)
         backend_api = self.instance.backend_api_choice or self.initial.get('backend_api_choice')
+        self.initial['fallback_backends'] = self.instance.fallback_backend_list
+        fallbacks = self.instance.fallback_backend_list
+        if self.is_bound:
+            backend_api = self.data.get('backend_api_choice', backend_api)
+            fallbacks = self.data.getlist('fallback_backends')
         
         self.fields['selected_model'].required = False
         self.fields['selected_character'].required = False
@@ -45,27 +70,22 @@ class BackendAPIChoiceForm(forms.ModelForm):
         self.fields['selected_ollama_model'].queryset = OllamaModel.objects.all()
         self.fields['selected_openai_model'].queryset = OpenAIModel.objects.all()
 
-        if backend_api == 'nebius':
-            self.fields['selected_character'].widget = forms.HiddenInput()
-            self.fields['selected_ollama_model'].widget = forms.HiddenInput()
-            self.fields['selected_openai_model'].widget = forms.HiddenInput()
-        elif backend_api == 'oobabooga':
-            self.fields['selected_model'].widget = forms.HiddenInput()
-            self.fields['selected_ollama_model'].widget = forms.HiddenInput()
-            self.fields['selected_openai_model'].widget = forms.HiddenInput()
-        elif backend_api == 'ollama':
-            self.fields['selected_model'].widget = forms.HiddenInput()
-            self.fields['selected_character'].widget = forms.HiddenInput()
-            self.fields['selected_openai_model'].widget = forms.HiddenInput()
-        elif backend_api == 'openai':
-            self.fields['selected_model'].widget = forms.HiddenInput()
-            self.fields['selected_character'].widget = forms.HiddenInput()
-            self.fields['selected_ollama_model'].widget = forms.HiddenInput()
-        else:
-            self.fields['selected_model'].widget = forms.HiddenInput()
-            self.fields['selected_character'].widget = forms.HiddenInput()
-            self.fields['selected_ollama_model'].widget = forms.HiddenInput()
-            self.fields['selected_openai_model'].widget = forms.HiddenInput()
+        # Fallbacks need a model too, so their fields are shown next to the selected backend's.
+        for backend, field in self.BACKEND_FIELDS.items():
+            if backend != backend_api and backend not in fallbacks:
+                self.fields[field].widget = forms.HiddenInput()
+
+    def clean_fallback_backends(self):
+        return ','.join(self.cleaned_data['fallback_backends'])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        labels = dict(Profile.BACKEND_API_CHOICES)
+        for backend in (cleaned_data.get('fallback_backends') or '').split(','):
+            field = self.BACKEND_FIELDS.get(backend)
+            if field and backend != cleaned_data.get('backend_api_choice') and not cleaned_data.get(field):
+                self.add_error(field, f'Select one to use {labels[backend]} as a fallback.')
+        return cleaned_data
 
 
 class CustomPasswordChangeForm(PasswordChangeForm):
@@ -111,25 +131,26 @@ class CustomAuthenticationForm(AuthenticationForm):
         })
     )
 
+    error_messages = {
+        **AuthenticationForm.error_messages,
+        'invalid_login': 'Invalid username or password.',
+    }
+
     def __init__(self, request=None, *args, **kwargs):
         super(CustomAuthenticationForm, self).__init__(request, *args, **kwargs)
 
-    def clean(self):
-        cleaned_data = super().clean()
-        username = cleaned_data.get('username')
-        password = cleaned_data.get('password')
-        otp_token = cleaned_data.get('otp_token')
-
-        if username and password:
-            user = authenticate(self.request, username=username, password=password)
-            if user is not None:
-                profile = user.profile
-                if profile.otp_enabled:
-                    if not otp_token:
-                        raise forms.ValidationError('This account requires an OTP code.')
-                    totp = pyotp.TOTP(profile.otp_secret_key)
-                    if not totp.verify(otp_token):
-                        raise forms.ValidationError('Invalid OTP code.')
-            else:
-                raise forms.ValidationError('Invalid username or password.')
-        return cleaned_data
\ No newline at end of file
+    def confirm_login_allowed(self, user):
+        """
+        Checks the OTP code of the user AuthenticationForm.clean just authenticated.
+
+        The password is hashed once by that authenticate call, the OTP check
+        reuses its result instead of authenticating again.
+        """
+        super().confirm_login_allowed(user)
+        profile = user.profile
+        if profile.otp_enabled:
+            otp_token = self.cleaned_data.get('otp_token')
+            if not otp_token:
+                raise forms.ValidationError('This account requires an OTP code.')
+            if not profile.verify_otp(otp_token):
+                raise forms.ValidationError('Invalid OTP code.')
\ No newline at end of file
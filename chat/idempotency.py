@@ -0,0 +1,157 @@
+# chat/idempotency.py
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import SingleFlightLock
+
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import wraps
+import hashlib
+import time
+import uuid
+
+__all__ = ['LockTimeout', 'acquire_lock', 'release_lock', 'single_flight_lock', 'conversation_lock', 'idempotent']
+
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+
+class LockTimeout(Exception):
+    """Raised when a lock is still held by another request after SINGLE_FLIGHT_WAIT seconds."""
+
+
+def _wait(attempt):
+    time.sleep(min(POLL_INTERVAL * 2 ** attempt, MAX_POLL_INTERVAL))
+
+def acquire_lock(key, timeout=None):
+    """
+    Tries to take a lock without waiting.
+
+    Locks are rows with a unique name in the database rather than cache
+    entries, because the file cache's add() is not atomic across workers.
+    An expired lock is taken over.
+
+    Args:
+        key (str): The lock name.
+        timeout (int, optional): Lock lifetime, SINGLE_FLIGHT_TIMEOUT by default.
+
+    Returns:
+        str or None: A token for release_lock, None if someone else holds the lock.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    try:
+        with transaction.atomic():
+            SingleFlightLock.objects.filter(name=key, expires_at__lte=now).delete()
+            SingleFlightLock.objects.create(
+                name=key, token=token, expires_at=now + timedelta(seconds=timeout or settings.SINGLE_FLIGHT_TIMEOUT),
+            )
+    except IntegrityError:
+        return None
+    return token
+
+def release_lock(key, token):
+    """Releases a lock taken with acquire_lock, unless it expired and was taken over."""
+    SingleFlightLock.objects.filter(name=key, token=token).delete()
+
+@contextmanager
+def single_flight_lock(key, timeout=None, wait=None):
+    """
+    Holds a lock shared by all workers, waiting for it if another request has it.
+
+    The lock expires after `timeout` seconds, so a worker that dies while
+    holding it does not block the key forever.
+
+    Args:
+        key (str): The lock name, unique among SingleFlightLock rows.
+        timeout (int, optional): Lock lifetime, SINGLE_FLIGHT_TIMEOUT by default.
+        wait (int, optional): How long to wait for the lock, SINGLE_FLIGHT_WAIT by default.
+
+    Raises:
+        LockTimeout: If the lock could not be taken in time.
+    """
+    deadline = time.monotonic() + (settings.SINGLE_FLIGHT_WAIT if wait is None else wait)
+    attempt = 0
+    while (token := acquire_lock(key, timeout)) is None:
+        if time.monotonic() >= deadline:
+            raise LockTimeout(key)
+        _wait(attempt)
+        attempt += 1
+    try:
+        yield
+    finally:
+        release_lock(key, token)
+
+def conversation_lock(conversation_id):
+    """Serializes requests that append to the same conversation."""
+    return single_flight_lock(f"conversation_lock:{conversation_id}")
+
+def _replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(scope):
+    """
+    Decorator that makes a POST view idempotent per Idempotency-Key header.
+
+    The first request with a key runs the view while holding a single-flight
+    lock, a SingleFlightLock row in the database. Duplicates that arrive while
+    it runs wait for its result instead of calling the backend again, and
+    later duplicates get the response stored in the shared cache for
+    IDEMPOTENCY_TTL seconds. Only successful
+    responses are stored: errors such as a busy conversation or missing
+    credits may go away, so a retry with the same key runs the view again.
+    Requests without the header are not affected.
+
+    Args:
+        scope (str): Name of the endpoint, keys are only compared within a scope.
+
+    Returns:
+        function: The decorated view function.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            key = request.headers.get('Idempotency-Key', '').strip()
+            if request.method != 'POST' or not key:
+                return view_func(request, *args, **kwargs)
+            if len(key) > 255:
+                return JsonResponse({'error': 'Idempotency-Key is too long.'}, status=400)
+            cache_key = f"idempotency:{scope}:{request.user.id}:{hashlib.sha256(key.encode()).hexdigest()}"
+            fingerprint = hashlib.sha256(request.body).hexdigest()
+            deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+            attempt = 0
+            while True:
+                stored = cache.get(cache_key)
+                if stored is not None:
+                    if stored['fingerprint'] != fingerprint:
+                        return JsonResponse({'error': 'Idempotency-Key was already used for a different request.'}, status=422)
+                    return _replay(stored)
+                token = acquire_lock(f"{cache_key}:lock")
+                if token is not None:
+                    break
+                if time.monotonic() >= deadline:
+                    return JsonResponse({'error': 'A request with this Idempotency-Key is still in progress.'}, status=409)
+                _wait(attempt)
+                attempt += 1
+
+            try:
+                response = view_func(request, *args, **kwargs)
+                if 200 <= response.status_code < 300 and not response.streaming:
+                    cache.set(cache_key, {
+                        'fingerprint': fingerprint,
+                        'status': response.status_code,
+                        'content': response.content,
+                        'content_type': response['Content-Type'],
+                    }, settings.IDEMPOTENCY_TTL)
+                return response
+            finally:
+                release_lock(f"{cache_key}:lock", token)
+        return wrapped_view
+    return decorator
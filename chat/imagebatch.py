@@ -0,0 +1,149 @@
+# chat/imagebatch.py
+
+from django.conf import settings
+
+from concurrent.futures import Future
+import base64
+import json
+import threading
+
+import requests
+
+__all__ = ['DEFAULT_PARAMS', 'ImageBatcher', 'image_batcher']
+
+DEFAULT_PARAMS = {
+    "steps": 20,
+    "cfg_scale": 5,
+    "width": 512,
+    "height": 512,
+    "seed": -1,
+}
+
+
+def _decode(image_data):
+    if "," in image_data:
+        image_data = image_data.split(",", 1)[1]
+    return base64.b64decode(image_data)
+
+
+class ImageBatcher:
+    """
+    Micro-batches concurrent txt2img requests into single Stable Diffusion calls.
+
+    Requests that can share a call are collected for up to SD_BATCH_WINDOW
+    seconds or until SD_MAX_BATCH_SIZE are waiting, then sent as one request
+    with batch_size set, and the images are handed back in order.
+
+    The SD WebUI API takes one prompt per call, so by default only requests
+    with the same prompt and parameters are grouped (each still gets its own
+    image, the batch uses consecutive seeds). With SD_BATCH_PROMPT_LISTS, for
+    servers that accept a list of prompts, any requests with the same
+    parameters are grouped.
+
+    Only random-seed (-1) requests are batched: the WebUI renders entry i of a
+    batch with seed + i, so a fixed seed would be wrong for all but the first.
+    Identical fixed-seed requests share one image from a single-image call.
+
+    Batching happens inside one worker process, across its request threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    @staticmethod
+    def _is_seeded(params):
+        return params.get('seed', -1) != -1
+
+    def _group_key(self, prompt, params):
+        key = json.dumps(params, sort_keys=True)
+        if settings.SD_BATCH_PROMPT_LISTS and not self._is_seeded(params):
+            return key
+        return (prompt, key)
+
+    def submit(self, prompt, params=None):
+        """
+        Queues a prompt for the next batch.
+
+        Args:
+            prompt (str): The text prompt.
+            params (dict, optional): txt2img parameters, DEFAULT_PARAMS by default.
+
+        Returns:
+            Future: Resolves to the image bytes, or None if generation failed.
+        """
+        params = dict(params or DEFAULT_PARAMS)
+        future = Future()
+        if settings.SD_BATCH_WINDOW <= 0 or settings.SD_MAX_BATCH_SIZE <= 1:
+            self._dispatch(params, [(prompt, future)])
+            return future
+
+        key = self._group_key(prompt, params)
+        full = None
+        with self.lock:
+            group = self.pending.setdefault(key, [])
+            group.append((prompt, future))
+            if len(group) >= settings.SD_MAX_BATCH_SIZE and not self._is_seeded(params):
+                full = self.pending.pop(key)
+            elif len(group) == 1:
+                timer = threading.Timer(settings.SD_BATCH_WINDOW, self._flush, (key, group, params))
+                timer.daemon = True
+                timer.start()
+        if full:
+            self._dispatch(params, full)
+        return future
+
+    def _flush(self, key, group, params):
+        with self.lock:
+            if self.pending.get(key) is not group:
+                return  # Already sent because it filled up.
+            del self.pending[key]
+        self._dispatch(params, group)
+
+    def _dispatch(self, params, batch):
+        """
+        Sends one batched call and resolves the futures of the batch with its images.
+
+        A fixed-seed batch holds identical requests, they all get the one image generated.
+        """
+        shared = self._is_seeded(params)
+        prompts = [prompt for prompt, _ in batch]
+        payload = dict(
+            params,
+            prompt=prompts if settings.SD_BATCH_PROMPT_LISTS and len(batch) > 1 and not shared else prompts[0],
+            batch_size=1 if shared else len(batch),
+            n_iter=1,
+            send_images=True,
+            save_images=False,
+        )
+        images = []
+        try:
+            response = requests.post(settings.SD_URL, json=payload, timeout=settings.SD_TIMEOUT)
+            if response.status_code == 200:
+                # The WebUI may put a grid of the whole batch first.
+                images = [_decode(image) for image in response.json().get('images', [])[-payload['batch_size']:]]
+            else:
+                print("API error:", response.text)
+        except Exception as e:
+            print(f"Error generating image: {e}")
+        for i, (_, future) in enumerate(batch):
+            if shared:
+                future.set_result(images[0] if images else None)
+            else:
+                future.set_result(images[i] if i < len(images) else None)
+
+    def generate(self, prompt, params=None):
+        """
+        Generates an image, waiting for the batch it joins.
+
+        Args:
+            prompt (str): The text prompt.
+            params (dict, optional): txt2img parameters, DEFAULT_PARAMS by default.
+
+        Returns:
+            bytes or None: The generated image or None if failed.
+        """
+        return self.submit(prompt, params).result(timeout=settings.SD_TIMEOUT + settings.SD_BATCH_WINDOW + 5)
+
+
+image_batcher = ImageBatcher()
@@ -0,0 +1,123 @@
+# chat/imagecache.py
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .cleanup import GENERATED_IMAGES_DIR, delete_unreferenced_media
+from .models import ImageCacheEntry
+
+import hashlib
+import json
+
+__all__ = ['generation_key', 'is_cacheable', 'store_image', 'cached_image', 'remember_image', 'evict']
+
+
+def generation_key(prompt, params):
+    """
+    Hashes everything that determines a generated image.
+
+    Args:
+        prompt (str): The text prompt.
+        params (dict): The txt2img parameters (steps, cfg_scale, size, seed).
+
+    Returns:
+        str: The cache key.
+    """
+    identity = {'prompt': prompt, 'params': params, 'model': settings.SD_MODEL, 'backend': settings.SD_URL}
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+def is_cacheable(params):
+    """
+    Tells whether IMAGE_CACHE_POLICY allows caching a generation with these parameters.
+
+    "all" caches every generation, "seeded" only those with a fixed seed, whose
+    result the backend would reproduce anyway, and "off" none.
+    """
+    policy = settings.IMAGE_CACHE_POLICY
+    if policy == 'all':
+        return True
+    if policy == 'seeded':
+        return params.get('seed', -1) not in (-1, None)
+    return False
+
+def store_image(image):
+    """
+    Saves image bytes under their content hash, once.
+
+    Args:
+        image (bytes): The PNG data.
+
+    Returns:
+        str: The storage name, shared by every message with the same image.
+    """
+    name = f"{GENERATED_IMAGES_DIR}/{hashlib.sha256(image).hexdigest()}.png"
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(image))
+        if saved != name:
+            # Another request stored the same bytes first.
+            default_storage.delete(saved)
+    return name
+
+def cached_image(key):
+    """
+    Looks up a cached image and marks it as recently used.
+
+    Args:
+        key (str): A generation_key.
+
+    Returns:
+        str or None: The storage name of the image, None on a miss.
+    """
+    name = ImageCacheEntry.objects.filter(key=key).values_list('image', flat=True).first()
+    if name is None:
+        return None
+    if not default_storage.exists(name):
+        ImageCacheEntry.objects.filter(key=key).delete()
+        return None
+    ImageCacheEntry.objects.filter(key=key).update(last_used=timezone.now(), hits=F('hits') + 1)
+    return name
+
+def remember_image(key, name, size):
+    """
+    Caches a stored image for its generation key, evicting old entries if the cache is full.
+
+    An existing entry is kept: the first image stored for a key wins, later
+    ones never overwrite it.
+
+    Args:
+        key (str): A generation_key.
+        name (str): The storage name returned by store_image.
+        size (int): The image size in bytes.
+    """
+    ImageCacheEntry.objects.get_or_create(key=key, defaults={'image': name, 'size': size, 'last_used': timezone.now()})
+    evict()
+
+def evict(max_bytes=None):
+    """
+    Drops least recently used entries until the cache fits its size limit.
+
+    Files of dropped entries are deleted unless a message still shows them.
+
+    Args:
+        max_bytes (int, optional): The limit, IMAGE_CACHE_MAX_BYTES by default.
+
+    Returns:
+        int: Number of entries dropped.
+    """
+    max_bytes = settings.IMAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total = ImageCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total <= max_bytes:
+        return 0
+    ids, names = [], []
+    for entry_id, name, size in ImageCacheEntry.objects.order_by('last_used').values_list('id', 'image', 'size').iterator():
+        if total <= max_bytes:
+            break
+        ids.append(entry_id)
+        names.append(name)
+        total -= size
+    ImageCacheEntry.objects.filter(id__in=ids).delete()
+    delete_unreferenced_media(names)
+    return len(ids)
@@ -0,0 +1,316 @@
+# chat/importer.py
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import bump_version
+from .models import Conversation, Message, ImportJob
+from .semantic import index_user
+
+from datetime import datetime, timedelta
+import io
+import json
+import os
+import re
+
+__all__ = ['import_storage', 'open_import_source', 'discard_import_source', 'delete_stale_import_uploads',
+           'iter_conversations', 'import_conversations', 'run_import_job', 'fill_missing_summaries']
+
+CHUNK_SIZE = 64 * 1024
+
+# Uploaded import files, kept outside MEDIA_ROOT so they are never served.
+import_storage = FileSystemStorage(location=settings.IMPORT_UPLOAD_DIR, base_url=None)
+EXPORT_HEADER = re.compile(r'\s*\{\s*"conversations"\s*:\s*\[')
+# The start of a number or literal that may continue in the next chunk.
+PARTIAL_TOKEN = re.compile(r'(-?\d*(\.\d*)?([eE][-+]?\d*)?|t(r(ue?)?)?|f(a(l(se?)?)?)?|n(u(ll?)?)?)\Z')
+SENDERS = {'user': 'user', 'human': 'user', 'bot': 'bot', 'assistant': 'bot', 'ai': 'bot'}
+
+
+def _incomplete(error, buffer):
+    """Tells whether a decode error only means the buffer ends inside a value."""
+    if error.msg.startswith('Invalid \\uXXXX escape'):
+        # The position is at the 'u'. The escape, or the low half of a surrogate
+        # pair after it, may continue in the next chunk.
+        return len(buffer) - error.pos <= 11
+    return (error.pos >= len(buffer) or error.msg.startswith('Unterminated string')
+            or PARTIAL_TOKEN.match(buffer, error.pos) is not None)
+
+def _iter_array(stream, buffer, offset=0):
+    """
+    Yields the elements of a JSON array whose opening bracket was already consumed.
+
+    Args:
+        stream (file): The rest of the text stream.
+        buffer (str): Text already read after the bracket.
+        offset (int): Position of the buffer in the stream, for error messages.
+
+    Raises:
+        ValueError: On malformed JSON, with its position, or if the stream ends inside the array.
+    """
+    decoder = json.JSONDecoder()
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos >= len(buffer):
+                raise json.JSONDecodeError('Need more data', buffer, pos)
+            obj, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if not _incomplete(e, buffer):
+                raise ValueError(f'{e.msg} at character {offset + e.pos} of the import file.')
+            # Reads at least as much as is buffered, so a large element is re-parsed a logarithmic number of times.
+            chunk = stream.read(max(CHUNK_SIZE, len(buffer) - pos))
+            if not chunk:
+                raise ValueError('Unexpected end of the conversations array.')
+            buffer, pos, offset = buffer[pos:] + chunk, 0, offset + pos
+            continue
+        yield obj
+
+def iter_conversations(stream):
+    """
+    Parses conversations from a text stream without loading it whole.
+
+    Accepts the export_all_conversations format ({"conversations": [...]})
+    and NDJSON with one conversation object per line.
+
+    Args:
+        stream (file): A text stream.
+
+    Yields:
+        dict: One conversation at a time.
+    """
+    buffer = stream.read(CHUNK_SIZE)
+    header = EXPORT_HEADER.match(buffer)
+    if header:
+        yield from _iter_array(stream, buffer[header.end():], header.end())
+        return
+    while buffer:
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            if buffer.strip():
+                yield json.loads(buffer)
+            return
+        buffer += chunk
+
+def _parse_timestamp(value, default, tz):
+    if not isinstance(value, str):
+        return default
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        timestamp = parse_datetime(value)
+    if timestamp is None:
+        return default
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, tz)
+    return timestamp
+
+def _normalize(data):
+    """Turns an imported conversation into (created_at, summary, [(sender, text, timestamp)])."""
+    tz = timezone.get_current_timezone()
+    created_at = _parse_timestamp(data.get('created_at'), timezone.now(), tz)
+    messages = []
+    for msg in data.get('messages') or []:
+        sender = SENDERS.get(str(msg.get('sender', msg.get('role', ''))).lower())
+        text = msg.get('text', msg.get('content'))
+        if sender and isinstance(text, str):
+            messages.append((sender, text, _parse_timestamp(msg.get('timestamp'), created_at, tz)))
+    return created_at, data.get('summary') or None, messages
+
+def _raw_insert(model, rows):
+    """
+    Inserts rows with a single executemany, skipping per-object model overhead.
+
+    Args:
+        model (type): The model class.
+        rows (list): Dicts of attname to value. Missing fields get their default.
+    """
+    connection = connections[router.db_for_write(model)]
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    defaults = {field.attname: field.get_db_prep_save(field.get_default(), connection) for field in fields}
+    prepare = {field.attname: field.get_db_prep_save for field in fields}
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+    params = []
+    for row in rows:
+        values = dict(defaults)
+        for attname, value in row.items():
+            values[attname] = prepare[attname](value, connection)
+        params.append([values[field.attname] for field in fields])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+def _flush(job, batch, processed):
+    """Inserts a batch of conversations with their messages and records the progress, in one transaction."""
+    with transaction.atomic():
+        conversations = Conversation.objects.bulk_create([
+            Conversation(user_id=job.user_id, created_at=created_at, summary=summary)
+            for created_at, summary, _ in batch
+        ])
+        messages = [
+            {'conversation_id': conversation.id, 'sender': sender, 'text': text, 'timestamp': timestamp, 'routing': 'imported'}
+            for conversation, (_, _, items) in zip(conversations, batch)
+            for sender, text, timestamp in items
+        ]
+        _raw_insert(Message, messages)
+        job.position += processed
+        job.imported_conversations += len(conversations)
+        job.imported_messages += len(messages)
+        job.save(update_fields=['position', 'imported_conversations', 'imported_messages', 'updated_at'])
+    bump_version('conversations', job.user_id)
+
+def import_conversations(job, stream, progress=None):
+    """
+    Imports conversations for the job's user in batches.
+
+    Each batch of up to IMPORT_BATCH_SIZE messages is inserted in its own
+    transaction, conversations with bulk_create and messages with one
+    executemany, together with the job's position, so an interrupted
+    import resumes after the last committed batch. Summaries are left empty
+    for fill_missing_summaries.
+
+    Args:
+        job (ImportJob): The job to run or resume.
+        stream (file): A text stream with the conversations.
+        progress (callable, optional): Called with the job after every batch.
+
+    Returns:
+        ImportJob: The finished job.
+    """
+    job.status = 'running'
+    job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    batch, pending, processed = [], 0, 0
+    try:
+        for index, data in enumerate(iter_conversations(stream)):
+            if index < job.position:
+                continue
+            processed += 1
+            conversation = _normalize(data)
+            if conversation[2]:
+                batch.append(conversation)
+                pending += len(conversation[2])
+            if pending >= settings.IMPORT_BATCH_SIZE:
+                _flush(job, batch, processed)
+                batch, pending, processed = [], 0, 0
+                if progress:
+                    progress(job)
+        if processed:
+            _flush(job, batch, processed)
+            if progress:
+                progress(job)
+        job.status = 'done'
+    except Exception as e:
+        print(f"Error importing conversations for job {job.id}: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    return job
+
+def _is_upload(job):
+    """Tells whether a job's source is an uploaded file rather than a path given to the command."""
+    return not os.path.isabs(job.source) and import_storage.exists(job.source)
+
+def open_import_source(job):
+    """
+    Opens the source of an import job as text.
+
+    Args:
+        job (ImportJob): A job created by the import endpoint (a name in
+            import_storage) or by the import_conversations command (a local path).
+
+    Returns:
+        file: A text stream.
+    """
+    if _is_upload(job):
+        return io.TextIOWrapper(import_storage.open(job.source, 'rb'), encoding='utf-8')
+    return open(job.source, encoding='utf-8')
+
+def discard_import_source(job):
+    """Deletes the uploaded file of a job, local files given to the command are left alone."""
+    if _is_upload(job):
+        import_storage.delete(job.source)
+
+def delete_stale_import_uploads(retention=None):
+    """
+    Deletes the uploads of failed import jobs nobody resumed.
+
+    Args:
+        retention (int, optional): Days a failed upload is kept for
+            `import_conversations --resume`, IMPORT_FAILED_RETENTION_DAYS by default.
+
+    Returns:
+        int: Number of uploads deleted.
+    """
+    retention = settings.IMPORT_FAILED_RETENTION_DAYS if retention is None else retention
+    cutoff = timezone.now() - timedelta(days=retention)
+    deleted = 0
+    for job in ImportJob.objects.filter(status='failed', updated_at__lt=cutoff).exclude(source=''):
+        if not _is_upload(job):
+            continue
+        discard_import_source(job)
+        job.source = ''
+        job.save(update_fields=['source', 'updated_at'])
+        deleted += 1
+    return deleted
+
+def run_import_job(job_id):
+    """
+    Runs an uploaded import in the background, then summarizes and indexes the new conversations.
+
+    Args:
+        job_id (int): The ImportJob whose source is a file in import_storage.
+    """
+    job = ImportJob.objects.get(id=job_id)
+    with open_import_source(job) as stream:
+        job = import_conversations(job, stream)
+    if job.status == 'done':
+        discard_import_source(job)
+        fill_missing_summaries(user_id=job.user_id)
+        if settings.SEMANTIC_SEARCH:
+            index_user(job.user_id)
+
+def fill_missing_summaries(user_id=None, limit=None):
+    """
+    Generates summaries for conversations that have none, such as imported ones.
+
+    Args:
+        user_id (int, optional): Only summarize this user's conversations.
+        limit (int, optional): Maximum number of conversations to summarize.
+
+    Returns:
+        int: The number of summaries written.
+    """
+    from .views import generate_summary
+
+    conversations = Conversation.objects.filter(summary__isnull=True, archived=False)
+    if user_id is not None:
+        conversations = conversations.filter(user_id=user_id)
+    conversations = conversations.order_by('id').values_list('id', 'user_id')
+    if limit:
+        conversations = conversations[:limit]
+
+    written = 0
+    for conversation_id, owner_id in conversations.iterator():
+        first = {}
+        for sender, text in Message.objects.filter(conversation_id=conversation_id, is_active=True).order_by('timestamp', 'id').values_list('sender', 'text')[:4]:
+            first.setdefault(sender, text)
+        if 'user' not in first or 'bot' not in first:
+            continue
+        summary = generate_summary(first['user'], first['bot'])
+        Conversation.objects.filter(id=conversation_id).update(summary=summary)
+        bump_version('conversations', owner_id)
+        written += 1
+    return written
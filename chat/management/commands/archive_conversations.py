@@ -0,0 +1,25 @@
+# chat/management/commands/archive_conversations.py
+
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_inactive_conversations, index_archives
+
+
+class Command(BaseCommand):
+    """
+    Moves inactive conversations into compressed storage. Meant to run from cron.
+
+    Also indexes archives written before they had search tokens.
+    """
+    help = 'Archive conversations that have been inactive for a number of days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Inactivity threshold, ARCHIVE_AFTER_DAYS by default.')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of conversations to archive.')
+
+    def handle(self, *args, **options):
+        archived = archive_inactive_conversations(days=options['days'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} conversations."))
+        indexed = index_archives()
+        if indexed:
+            self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} older archives."))
@@ -0,0 +1,66 @@
+# chat/management/commands/bench_db_writes.py
+
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+
+from chat.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    """
+    Measures concurrent chat write throughput against the configured database.
+
+    Each worker thread owns a conversation and inserts messages one at a time,
+    one transaction per write, the same way send_message does. Run it once per
+    database profile to compare them, for example:
+
+        DATABASE_ENGINE=sqlite python manage.py bench_db_writes
+        DATABASE_ENGINE=postgres python manage.py bench_db_writes
+
+    With the default SQLite journal, writers fail with "database is locked" as soon
+    as the workers overlap. The WAL profile serializes them behind the busy timeout
+    instead, and postgres keeps scaling with the number of workers.
+    """
+    help = 'Benchmark concurrent message writes on the configured database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Number of concurrent writers.')
+        parser.add_argument('--writes', type=int, default=250, help='Messages written per thread.')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        writes = options['writes']
+        user, _ = User.objects.get_or_create(username='__bench_db_writes__')
+        conversations = [Conversation.objects.create(user=user) for _ in range(threads)]
+        errors = []
+
+        def writer(conversation):
+            try:
+                for i in range(writes):
+                    try:
+                        Message.objects.create(conversation=conversation, sender='user', text=f'bench message {i}')
+                    except OperationalError as e:
+                        errors.append(str(e))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=writer, args=(conv,)) for conv in conversations]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        written = Message.objects.filter(conversation__user=user).count()
+        user.delete()
+
+        self.stdout.write(f"Database: {connection.vendor} ({connection.settings_dict['NAME']})")
+        self.stdout.write(f"Writers: {threads}, messages written: {written}/{threads * writes}, errors: {len(errors)}")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s, throughput: {written / elapsed:.0f} writes/s")
+        if errors:
+            self.stdout.write(self.style.WARNING(f"First error: {errors[0]}"))
@@ -0,0 +1,28 @@
+# chat/management/commands/build_semantic_index.py
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.semantic import drop_index, index_user
+
+
+class Command(BaseCommand):
+    """Brings the semantic search index up to date, for example after changing the embedder."""
+    help = 'Embed messages and summaries that are not in the semantic search index yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only index this username.')
+        parser.add_argument('--rebuild', action='store_true', help='Drop the existing index first.')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(conversation__isnull=False).distinct()
+        if options['user']:
+            users = User.objects.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist.")
+        total = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            if options['rebuild']:
+                drop_index(user_id)
+            total += index_user(user_id)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} messages and summaries."))
@@ -0,0 +1,31 @@
+# chat/management/commands/collect_media.py
+
+from django.core.management.base import BaseCommand
+
+from chat.cleanup import collect_orphaned_media
+from chat.imagecache import evict
+from chat.importer import delete_stale_import_uploads
+
+
+class Command(BaseCommand):
+    """Removes generated images that no message refers to, and uploads of failed imports. Meant to run from cron."""
+    help = 'Garbage-collect orphaned generated images under MEDIA_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-period', type=int, default=None, help='Minimum file age in seconds.')
+        parser.add_argument('--dry-run', action='store_true', help='List orphaned files without deleting them.')
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            # Applies a lowered IMAGE_CACHE_MAX_MB; the evicted images are then collected below if unused.
+            evicted = evict()
+            if evicted:
+                self.stdout.write(f"Evicted {evicted} image cache entries.")
+            uploads = delete_stale_import_uploads()
+            if uploads:
+                self.stdout.write(f"Deleted {uploads} uploads of failed imports.")
+        orphaned = collect_orphaned_media(grace_period=options['grace_period'], dry_run=options['dry_run'])
+        for name in orphaned:
+            self.stdout.write(name)
+        action = 'Found' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(orphaned)} orphaned files."))
@@ -0,0 +1,54 @@
+# chat/management/commands/import_conversations.py
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.importer import discard_import_source, fill_missing_summaries, import_conversations, open_import_source
+from chat.models import ImportJob
+
+import os
+
+
+class Command(BaseCommand):
+    """Bulk-imports conversations from an export file or NDJSON."""
+    help = 'Import conversations for a user from an export_all_conversations JSON file or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', nargs='?', help='The user who will own the conversations.')
+        parser.add_argument('path', nargs='?', help='The JSON or NDJSON file to import.')
+        parser.add_argument('--resume', type=int, default=None, help='Resume an interrupted import job by id.')
+        parser.add_argument('--skip-summaries', action='store_true', help='Do not generate missing summaries afterwards.')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                job = ImportJob.objects.get(id=options['resume'])
+            except ImportJob.DoesNotExist:
+                raise CommandError(f"Import job {options['resume']} does not exist.")
+            if not job.source:
+                raise CommandError(f"The file of import job {job.id} was already deleted.")
+        else:
+            if not options['username'] or not options['path']:
+                raise CommandError('Give a username and a path, or --resume with a job id.')
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['username']} does not exist.")
+            job = ImportJob.objects.create(user=user, source=os.path.abspath(options['path']))
+            self.stdout.write(f"Started import job {job.id}.")
+
+        def progress(job):
+            self.stdout.write(f"{job.imported_conversations} conversations, {job.imported_messages} messages")
+
+        with open_import_source(job) as stream:
+            job = import_conversations(job, stream, progress=progress)
+        if job.status == 'done':
+            discard_import_source(job)
+        else:
+            raise CommandError(f"Import job {job.id} failed: {job.error}. Resume it with --resume {job.id}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {job.imported_conversations} conversations with {job.imported_messages} messages."
+        ))
+        if not options['skip_summaries']:
+            written = fill_missing_summaries(user_id=job.user_id)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} summaries."))
@@ -0,0 +1,19 @@
+# chat/management/commands/rollup_usage.py
+
+from django.core.management.base import BaseCommand
+
+from chat.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    """Folds new messages and reactions into the usage rollups. Meant to run from cron."""
+    help = 'Update usage rollups (messages, tokens, images, credits and reactions per user, backend and model).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Ids per transaction, ROLLUP_BATCH_SIZE by default.')
+
+    def handle(self, *args, **options):
+        processed = update_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {processed['messages']} message ids and {processed['reactions']} reaction events."
+        ))
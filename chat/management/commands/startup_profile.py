@@ -0,0 +1,106 @@
+# chat/management/commands/startup_profile.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BOOT_SCRIPTS = {
+    # What every management command pays.
+    'setup': (
+        "import django\n"
+        "django.setup()\n"
+    ),
+    # What a web worker pays before its first request: apps, middleware and the URLconf with all views.
+    'wsgi': (
+        "from django.core.wsgi import get_wsgi_application\n"
+        "get_wsgi_application()\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+}
+TIMER = (
+    "import json, time\n"
+    "start = time.perf_counter()\n"
+    "{script}"
+    "print(json.dumps({{'boot_ms': (time.perf_counter() - start) * 1000}}))\n"
+)
+
+
+def run_boot(target, importtime=False):
+    """
+    Boots Django in a fresh interpreter.
+
+    Args:
+        target (str): A key of BOOT_SCRIPTS.
+        importtime (bool): Run with -X importtime.
+
+    Returns:
+        tuple: The boot time in milliseconds and the interpreter's stderr.
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', TIMER.format(script=BOOT_SCRIPTS[target])]
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'djangoai.settings'))
+    result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise CommandError(f"Boot failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])['boot_ms'], result.stderr
+
+def parse_importtime(output):
+    """
+    Parses -X importtime output.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds) per import.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+class Command(BaseCommand):
+    """Measures how long Django takes to boot and which imports cost the most."""
+    help = 'Report import-time breakdowns of a cold start and fail if it exceeds STARTUP_BUDGET_MS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(BOOT_SCRIPTS), default='wsgi',
+                            help='"setup" for management commands, "wsgi" for web workers (default).')
+        parser.add_argument('--runs', type=int, default=5, help='Timed boots, the median is compared to the budget.')
+        parser.add_argument('--budget', type=float, default=None, help='Milliseconds, STARTUP_BUDGET_MS by default.')
+        parser.add_argument('--top', type=int, default=15, help='Rows per table.')
+
+    def handle(self, *args, **options):
+        budget = options['budget'] or settings.STARTUP_BUDGET_MS
+        timings = [run_boot(options['target'])[0] for _ in range(max(options['runs'], 1))]
+        _, output = run_boot(options['target'], importtime=True)
+        imports = parse_importtime(output)
+
+        packages = {}
+        for name, self_us, _ in imports:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+        self.stdout.write('Self time by top-level package:')
+        for package, total in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f"  {total / 1000:8.1f} ms  {package}")
+
+        self.stdout.write('Slowest project modules (cumulative, includes what they import):')
+        project = [entry for entry in imports if entry[0].split('.')[0] in ('chat', 'djangoai')]
+        for name, _, cumulative_us in sorted(project, key=lambda entry: -entry[2])[:options['top']]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+        boot_ms = statistics.median(timings)
+        summary = (f"{options['target']} boot: median {boot_ms:.0f} ms, min {min(timings):.0f} ms "
+                   f"over {len(timings)} runs (budget {budget:.0f} ms)")
+        if boot_ms > budget:
+            raise CommandError(f"{summary}. Over budget, see the breakdown above.")
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,46 @@
+# chat/management/commands/sync_replica.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+import sqlite3
+import time
+
+
+class Command(BaseCommand):
+    """
+    Copies the SQLite primary into the SQLite replica, to try replica routing locally.
+
+    Usage:
+        SQLITE_REPLICA_PATH=replica.sqlite3 python manage.py sync_replica
+        SQLITE_REPLICA_PATH=replica.sqlite3 python manage.py sync_replica --interval 5
+
+    Run it repeatedly with --interval to simulate replication lag. Postgres
+    replicas are kept up to date by streaming replication instead.
+    """
+    help = 'Copy the SQLite primary database into the SQLite replica.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Keep copying every N seconds.')
+
+    def handle(self, *args, **options):
+        replica = settings.DATABASE_REPLICA
+        if not replica:
+            raise CommandError('No replica configured, set SQLITE_REPLICA_PATH.')
+        if connections['default'].vendor != 'sqlite' or connections[replica].vendor != 'sqlite':
+            raise CommandError('sync_replica only copies SQLite databases.')
+        while True:
+            start = time.perf_counter()
+            source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+            target = sqlite3.connect(settings.DATABASES[replica]['NAME'])
+            try:
+                # The online backup API takes a consistent snapshot while writers keep going.
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(self.style.SUCCESS(f"Replica synced in {(time.perf_counter() - start) * 1000:.0f} ms."))
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
@@ -1,15 +1,17 @@
 # chat/middleware.py
 
 from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
 import threading
 import time
-from openai import OpenAI
-import requests
 import os
 from .models import OllamaModel, OpenAIModel, NebiusModel
+from .backends import openai_client
+from .context import load_user_context
+from .replicas import pin_to_primary
 from dotenv import load_dotenv
 
-__all__ = ['ModelSyncMiddleware']
+__all__ = ['ModelSyncMiddleware', 'UserContextMiddleware', 'ReplicaPinMiddleware']
 
 load_dotenv()
 
@@ -37,14 +39,8 @@ class ModelSyncThread(threading.Thread):
     def sync_openai_nebius_models(self):
         """Sync OpenAI and Nebius models."""
         try:
-            client_openai = OpenAI(
-                base_url="https://api.openai.com/v1/",
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-            client_nebius = OpenAI(
-                base_url="https://api.studio.nebius.ai/v1/",
-                api_key=os.getenv("NEBIUS_API_KEY")
-            )
+            client_openai = openai_client('openai')
+            client_nebius = openai_client('nebius')
             
             openai_models = client_openai.models.list()
             current_openai_models = set(OpenAIModel.objects.values_list('name', flat=True))
@@ -70,6 +66,8 @@ class ModelSyncThread(threading.Thread):
             
     def sync_ollama_models(self):
         """Sync Ollama models."""
+        import requests
+
         try:
             ollama_url = os.getenv("OLLAMA_URL")
             response = requests.get(f"{ollama_url}/api/tags")
@@ -92,24 +90,58 @@ class ModelSyncThread(threading.Thread):
             print(f"Error syncing Ollama models: {e}")
 
 class ModelSyncMiddleware:
-    """Middleware to handle model synchronization on application startup."""
+    """
+    Middleware to handle model synchronization.
+
+    The sync thread starts on the first request rather than when the
+    middleware is constructed, so booting a worker does no network work.
+    """
     
     def __init__(self, get_response):
         self.get_response = get_response
         self.sync_thread = None
-        self.initialize_sync_thread()
+        self.lock = threading.Lock()
     
     def initialize_sync_thread(self):
         """Initialize and start the model sync thread if not already running."""
-        if not self.sync_thread or not self.sync_thread.is_alive():
-            self.sync_thread = ModelSyncThread()
-            self.sync_thread.start()
+        with self.lock:
+            if not self.sync_thread or not self.sync_thread.is_alive():
+                self.sync_thread = ModelSyncThread()
+                self.sync_thread.start()
     
     def __call__(self, request):
+        if self.sync_thread is None:
+            self.initialize_sync_thread()
         return self.get_response(request)
     
     def __del__(self):
         """Clean up the sync thread when the middleware is destroyed."""
         if self.sync_thread:
             self.sync_thread.stop_flag.set()
-            self.sync_thread.join(timeout=1)
\ No newline at end of file
+            self.sync_thread.join(timeout=1)
+
+class UserContextMiddleware:
+    """Middleware that attaches a lazily loaded UserContext to authenticated requests."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.user_context = SimpleLazyObject(
+            lambda: load_user_context(request.user) if request.user.is_authenticated else None
+        )
+        return self.get_response(request)
+
+class ReplicaPinMiddleware:
+    """Middleware that keeps users on the primary database for a short while after they write."""
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in self.SAFE_METHODS and request.user.is_authenticated:
+            pin_to_primary(request.user.id)
+        return response
@@ -2,26 +2,43 @@
 
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_version
 
-import pyotp
 import uuid
 
 class Conversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True) 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     summary = models.TextField(blank=True, null=True)
+    archived = models.BooleanField(default=False, db_index=True)
     def __str__(self):
         return f'Conversation {self.id}'
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
-    sender = models.CharField(max_length=10)
+    sender = models.CharField(max_length=10, db_index=True)
     text = models.TextField()
     image = models.ImageField(upload_to='generated_images/', blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    ROUTING_CHOICES = [
+        ('selected', 'Selected backend'),
+        ('routed', 'Routed to a healthier backend'),
+        ('failover', 'Failed over'),
+        ('hedged', 'Hedged'),
+        ('imported', 'Imported history'),
+    ]
+    backend = models.CharField(max_length=20, blank=True, default='', db_index=True)
+    model_name = models.CharField(max_length=255, blank=True, default='')
+    routing = models.CharField(max_length=10, choices=ROUTING_CHOICES, blank=True, default='')
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='variants')
+    is_active = models.BooleanField(default=True)
+    html = models.TextField(blank=True, default='')
+    html_version = models.PositiveSmallIntegerField(default=0)
     @property
     def reaction_counts(self):
         return {
@@ -71,20 +88,32 @@ class Profile(models.Model):
     selected_character = models.ForeignKey(OobaboogaCharacter, on_delete=models.SET_NULL, null=True, blank=True, related_name='profiles')
     selected_ollama_model = models.ForeignKey(OllamaModel, on_delete=models.SET_NULL, null=True, blank=True, related_name='ollama_profiles')
     selected_openai_model = models.ForeignKey(OpenAIModel, on_delete=models.SET_NULL, null=True, blank=True, related_name='openai_profiles')
+    hedge_requests = models.BooleanField(default=False)
+    fallback_backends = models.CharField(max_length=100, blank=True, default='')
     
     def __str__(self):
         return f'Profile for {self.user.username}'
 
+    @property
+    def fallback_backend_list(self):
+        return [backend for backend in self.fallback_backends.split(',') if backend]
+
     def generate_otp_secret_key(self):
+        import pyotp
+
         self.otp_secret_key = pyotp.random_base32()
         self.save()
 
+    def verify_otp(self, otp_token):
+        import pyotp
+
+        return pyotp.TOTP(self.otp_secret_key).verify(otp_token)
+
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
-    else:
-        instance.profile.save()
+        Credits.objects.create(user=instance, credits=500)
         
 class Prompt(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -104,7 +133,137 @@ class MessageReaction(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='reactions')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     reaction = models.CharField(max_length=5, choices=REACTION_CHOICES)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         unique_together = ['message', 'user']
+        # Serves the admin's reaction filter, whose pages are ordered by -id.
+        indexes = [models.Index(fields=['reaction', '-id'])]
+
+class ArchivedConversation(models.Model):
+    CODEC_CHOICES = [
+        ('zlib', 'zlib'),
+        ('zstd', 'Zstandard'),
+    ]
+    conversation = models.OneToOneField(Conversation, on_delete=models.CASCADE, related_name='archive')
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES, default='zlib')
+    data = models.BinaryField()
+    message_count = models.PositiveIntegerField(default=0)
+    image_names = models.TextField(blank=True, default='')
+    # The distinct lowercased words of the messages, so searches only decompress
+    # archives that can match. NULL for archives written before the column.
+    search_tokens = models.TextField(null=True, blank=True)
+    min_message_id = models.BigIntegerField(null=True, blank=True)
+    max_message_id = models.BigIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Archive of conversation {self.conversation_id}'
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    source = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    position = models.PositiveIntegerField(default=0)
+    imported_conversations = models.PositiveIntegerField(default=0)
+    imported_messages = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Import {self.id} for {self.user.username}'
+
+class UsageRollup(models.Model):
+    """Daily usage of one user on one backend/model, maintained by chat.rollups."""
+    date = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_rollups')
+    backend = models.CharField(max_length=20, blank=True, default='')
+    model_name = models.CharField(max_length=255, blank=True, default='')
+    user_messages = models.PositiveIntegerField(default=0)
+    bot_messages = models.PositiveIntegerField(default=0)
+    failed_responses = models.PositiveIntegerField(default=0)
+    images = models.PositiveIntegerField(default=0)
+    tokens = models.PositiveBigIntegerField(default=0)
+    credits_spent = models.PositiveIntegerField(default=0)
+    reactions_up = models.IntegerField(default=0)
+    reactions_down = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['date', 'user', 'backend', 'model_name']
+        indexes = [models.Index(fields=['date', 'backend', 'model_name'])]
+
+    def __str__(self):
+        return f'Usage of {self.backend or "-"}/{self.model_name or "-"} on {self.date}'
+
+    @property
+    def reaction_ratio(self):
+        total = self.reactions_up + self.reactions_down
+        return self.reactions_up / total if total else None
+
+class ReactionEvent(models.Model):
+    """Append-only log of reactions given and retracted, so rollups can apply them as deltas."""
+    message_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    backend = models.CharField(max_length=20, blank=True, default='')
+    model_name = models.CharField(max_length=255, blank=True, default='')
+    reaction = models.CharField(max_length=5, choices=MessageReaction.REACTION_CHOICES)
+    delta = models.SmallIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} rolled up to {self.last_id}'
+
+class SingleFlightLock(models.Model):
+    """A lock held by one request, see chat.idempotency. The unique name makes taking it atomic."""
+    name = models.CharField(max_length=255, unique=True)
+    token = models.CharField(max_length=32)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'Lock {self.name}'
+
+class ImageCacheEntry(models.Model):
+    """A generated image stored under a hash of its prompt and parameters, maintained by chat.imagecache."""
+    key = models.CharField(max_length=64, unique=True)
+    image = models.CharField(max_length=255, db_index=True)
+    size = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f'Cached image {self.image}'
+
+@receiver([post_save, post_delete], sender=Conversation)
+def invalidate_conversation_list(sender, instance, **kwargs):
+    bump_version('conversations', instance.user_id)
+
+@receiver(post_delete, sender=Conversation)
+def invalidate_conversation(sender, instance, **kwargs):
+    bump_version('conversation', instance.id)
+
+@receiver([post_save, post_delete], sender=Prompt)
+def invalidate_prompts(sender, instance, **kwargs):
+    bump_version('prompts')
+
+@receiver([post_save, post_delete], sender=Message)
+def invalidate_conversation_messages(sender, instance, **kwargs):
+    bump_version('conversation', instance.conversation_id)
+
+@receiver([post_save, post_delete], sender=MessageReaction)
+def invalidate_conversation_reactions(sender, instance, **kwargs):
+    conversation_id = Message.objects.filter(pk=instance.message_id).values_list('conversation_id', flat=True).first()
+    if conversation_id:
+        bump_version('reactions', conversation_id)
@@ -0,0 +1,111 @@
+# chat/prompts.py
+
+from .cache import get_version
+from .replicas import read_from_primary
+from .models import Prompt
+
+import bisect
+import difflib
+import re
+import threading
+
+__all__ = ['PromptIndex', 'get_prompt_index']
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Splits text into lowercase word tokens."""
+    return TOKEN_RE.findall((text or '').lower())
+
+class PromptIndex:
+    """
+    In-memory prefix and fuzzy search index over prompt names and explanations.
+
+    Every token of the name and explanation goes into a sorted vocabulary, so
+    prefix lookups are a bisect plus a short scan. Query terms that match no
+    prefix fall back to difflib close matches to tolerate typos.
+    """
+    NAME_WEIGHT = 3.0
+    EXPLANATION_WEIGHT = 1.0
+    PREFIX_FACTOR = 0.8
+    FUZZY_FACTOR = 0.5
+    NAME_PREFIX_BONUS = 5.0
+
+    def __init__(self, prompts):
+        self.prompts = {prompt['id']: prompt for prompt in prompts}
+        self.ordered_ids = sorted(self.prompts, key=lambda prompt_id: self.prompts[prompt_id]['name'].lower())
+        self.postings = {}
+        for prompt in prompts:
+            for token in set(tokenize(prompt['explanation'])):
+                self.postings.setdefault(token, {})[prompt['id']] = self.EXPLANATION_WEIGHT
+            for token in set(tokenize(prompt['name'])):
+                self.postings.setdefault(token, {})[prompt['id']] = self.NAME_WEIGHT
+        self.vocabulary = sorted(self.postings)
+
+    def _expand(self, term):
+        """Returns (token, factor) pairs of vocabulary tokens matching a query term."""
+        matches = []
+        i = bisect.bisect_left(self.vocabulary, term)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(term):
+            token = self.vocabulary[i]
+            matches.append((token, 1.0 if token == term else self.PREFIX_FACTOR))
+            i += 1
+        if not matches and len(term) > 2:
+            matches = [(token, self.FUZZY_FACTOR) for token in difflib.get_close_matches(term, self.vocabulary, n=3, cutoff=0.75)]
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Returns the best matching prompts.
+
+        Args:
+            query (str): Search text; every term has to match.
+            limit (int): Maximum number of results.
+
+        Returns:
+            list: Prompt dicts with id, name and explanation, best first. Without
+            query terms, the first prompts by name.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return [self.prompts[prompt_id] for prompt_id in self.ordered_ids[:limit]]
+
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token, factor in self._expand(term):
+                for prompt_id, weight in self.postings[token].items():
+                    term_scores[prompt_id] = max(term_scores.get(prompt_id, 0), weight * factor)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {prompt_id: scores[prompt_id] + score for prompt_id, score in term_scores.items() if prompt_id in scores}
+
+        normalized = ' '.join(terms)
+        for prompt_id in scores:
+            if ' '.join(tokenize(self.prompts[prompt_id]['name'])).startswith(normalized):
+                scores[prompt_id] += self.NAME_PREFIX_BONUS
+        ranked = sorted(scores, key=lambda prompt_id: (-scores[prompt_id], self.prompts[prompt_id]['name'].lower()))
+        return [self.prompts[prompt_id] for prompt_id in ranked[:limit]]
+
+
+_index = (None, None)
+_index_lock = threading.Lock()
+
+def get_prompt_index():
+    """
+    Returns the process-wide prompt index, rebuilt when the prompt table changes.
+
+    Prompt save/delete signals bump the shared 'prompts' cache version, so every
+    worker notices the change on its next lookup.
+    """
+    global _index
+    version = get_version('prompts')
+    if _index[0] != version:
+        with _index_lock:
+            if _index[0] != version:
+                # The index is kept until the next version bump, so it is built from the primary.
+                with read_from_primary():
+                    _index = (version, PromptIndex(list(Prompt.objects.values('id', 'name', 'explanation'))))
+    return _index[1]
@@ -0,0 +1,32 @@
+# chat/qr.py
+
+from io import BytesIO
+import base64
+
+__all__ = ['qr_code_base64', 'otp_qr_code_base64']
+
+
+def qr_code_base64(data):
+    """
+    Renders data as a PNG QR code.
+
+    qrcode and Pillow are imported on the first call, only the 2FA setup needs them.
+
+    Args:
+        data (str): The text to encode.
+
+    Returns:
+        str: The base64-encoded PNG.
+    """
+    import qrcode
+
+    buffered = BytesIO()
+    qrcode.make(data).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+def otp_qr_code_base64(username, secret_key):
+    """Returns the QR code an authenticator app scans to add the account's TOTP secret."""
+    import pyotp
+
+    otp_auth_url = pyotp.TOTP(secret_key).provisioning_uri(name=username, issuer_name="DjangoAI")
+    return qr_code_base64(otp_auth_url)
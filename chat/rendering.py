@@ -0,0 +1,101 @@
+# chat/rendering.py
+
+from .models import Message
+
+import threading
+
+__all__ = ['RENDERER_VERSION', 'render_markdown', 'rendered_fields', 'ensure_rendered', 'ensure_rendered_rows',
+           'archived_message_html']
+
+# Bump when the output of render_markdown changes, stored HTML is then re-rendered on its next read.
+RENDERER_VERSION = 1
+
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em', 'del', 'blockquote',
+    'ul', 'ol', 'li', 'a', 'code', 'pre', 'span', 'div', 'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'code': {'class'},
+    'div': {'class'},
+    'pre': {'class'},
+    'span': {'class'},
+    'td': {'align'},
+    'th': {'align'},
+}
+
+_local = threading.local()
+
+
+def _markdown():
+    """Returns this thread's Markdown converter, which is not safe to share between threads."""
+    md = getattr(_local, 'markdown', None)
+    if md is None:
+        import markdown
+
+        md = markdown.Markdown(
+            extensions=['fenced_code', 'codehilite', 'tables', 'sane_lists'],
+            extension_configs={'codehilite': {'guess_lang': False}},
+        )
+        # Raw HTML in a message is shown as text, as the client did before.
+        md.preprocessors.deregister('html_block')
+        md.inlinePatterns.deregister('html')
+        _local.markdown = md
+    return md.reset()
+
+def render_markdown(text):
+    """
+    Renders a message to sanitized HTML, with Pygments highlighting for fenced code.
+
+    Args:
+        text (str): The Markdown text.
+
+    Returns:
+        str: HTML that is safe to insert into the page.
+    """
+    import nh3
+
+    html = _markdown().convert(text)
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES)
+
+def rendered_fields(text):
+    """Returns the html and html_version field values for a new bot message."""
+    return {'html': render_markdown(text), 'html_version': RENDERER_VERSION}
+
+def ensure_rendered(messages):
+    """
+    Renders bot messages whose HTML is missing or from an older renderer, and stores it.
+
+    Messages written before rendering existed, and imported ones, are rendered
+    on their first read. Later reads use the stored HTML.
+
+    Args:
+        messages (list): Message objects, updated in place.
+    """
+    stale = [msg for msg in messages if msg.sender == 'bot' and msg.text and msg.html_version != RENDERER_VERSION]
+    for msg in stale:
+        msg.html, msg.html_version = render_markdown(msg.text), RENDERER_VERSION
+    if stale:
+        Message.objects.bulk_update(stale, ['html', 'html_version'])
+
+def ensure_rendered_rows(rows):
+    """
+    Like ensure_rendered, for message dicts from values().
+
+    Args:
+        rows (list): Dicts with id, sender, text, html and html_version, updated in place.
+    """
+    stale = [row for row in rows if row['sender'] == 'bot' and row['text'] and row['html_version'] != RENDERER_VERSION]
+    for row in stale:
+        row['html'], row['html_version'] = render_markdown(row['text']), RENDERER_VERSION
+    if stale:
+        Message.objects.bulk_update(
+            [Message(id=row['id'], html=row['html'], html_version=RENDERER_VERSION) for row in stale],
+            ['html', 'html_version'],
+        )
+
+def archived_message_html(msg):
+    """Returns the HTML of an archived bot message dict, rendering it if the archive predates the renderer."""
+    if msg.get('html_version') == RENDERER_VERSION:
+        return msg['html']
+    return render_markdown(msg['text']) if msg['text'] else ''
@@ -0,0 +1,98 @@
+# chat/replicas.py
+
+from django.conf import settings
+from django.core.cache import cache
+
+from contextlib import contextmanager
+from functools import wraps
+import threading
+
+__all__ = ['ReplicaRouter', 'use_replica', 'read_from_primary', 'pin_to_primary', 'is_pinned']
+
+# Only the chat tables are read from the replica. Sessions and users always come
+# from the primary, so a fresh login is never lost to replication lag.
+REPLICA_APPS = {'chat'}
+
+_local = threading.local()
+
+
+def _pin_key(user_id):
+    return f"replica_pin:{user_id}"
+
+def is_pinned(user_id):
+    """Tells whether a user wrote recently and must read from the primary."""
+    return cache.get(_pin_key(user_id)) is not None
+
+def pin_to_primary(user_id=None):
+    """
+    Sends a user's reads to the primary for REPLICA_STICKY_SECONDS, and the rest of this request too.
+
+    Called after every write request, so a message the user just sent is
+    visible on the next read even if the replica has not caught up yet.
+
+    Args:
+        user_id (int, optional): The user who wrote, only the current request is pinned without one.
+    """
+    _local.active = False
+    if settings.DATABASE_REPLICA and user_id is not None:
+        cache.set(_pin_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+@contextmanager
+def read_from_primary():
+    """
+    Reads from the primary inside a @use_replica view.
+
+    For loaders whose result is cached under a version key: data read from a
+    lagging replica would otherwise stay cached after the replica caught up.
+    """
+    previous = getattr(_local, 'active', False)
+    _local.active = False
+    try:
+        yield
+    finally:
+        _local.active = previous
+
+def use_replica(view_func):
+    """
+    Decorator for read-only views whose chat queries may go to the DATABASE_REPLICA alias.
+
+    Users who wrote within REPLICA_STICKY_SECONDS keep reading from the
+    primary. Without a replica configured the decorator does nothing.
+
+    Args:
+        view_func (function): The view function to decorate.
+
+    Returns:
+        function: The decorated view function.
+    """
+    @wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        if not settings.DATABASE_REPLICA or (request.user.is_authenticated and is_pinned(request.user.id)):
+            return view_func(request, *args, **kwargs)
+        previous = getattr(_local, 'active', False)
+        _local.active = True
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _local.active = previous
+    return wrapped_view
+
+
+class ReplicaRouter:
+    """Routes reads of @use_replica views to the replica, everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if getattr(_local, 'active', False) and model._meta.app_label in REPLICA_APPS:
+            return settings.DATABASE_REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication (or sync_replica for SQLite).
+        return db == 'default'
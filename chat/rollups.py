@@ -0,0 +1,152 @@
+# chat/rollups.py
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Length, TruncDate
+from django.utils import timezone
+
+from .models import Message, ReactionEvent, RollupWatermark, UsageRollup
+
+from datetime import timedelta
+
+__all__ = ['IMAGE_CREDITS', 'ROLLUP_FIELDS', 'record_reaction_event', 'update_rollups', 'usage_report']
+
+IMAGE_CREDITS = 5
+ROLLUP_FIELDS = ('user_messages', 'bot_messages', 'failed_responses', 'images', 'tokens', 'credits_spent',
+                 'reactions_up', 'reactions_down')
+
+
+def record_reaction_event(message, user_id, reaction, delta):
+    """
+    Logs a reaction being given (delta 1) or retracted (delta -1).
+
+    The backend and model are copied from the message, so the event still
+    counts for the right model after the message is archived or deleted.
+    A retraction is only logged if a matching reaction was logged before;
+    reactions given before the event log existed were never counted.
+    """
+    if delta < 0:
+        logged = ReactionEvent.objects.filter(message_id=message.id, user_id=user_id, reaction=reaction).aggregate(
+            total=Sum('delta', default=0))['total']
+        if logged <= 0:
+            return
+    ReactionEvent.objects.create(message_id=message.id, user_id=user_id, backend=message.backend,
+                                 model_name=message.model_name, reaction=reaction, delta=delta)
+
+def _apply(key, deltas):
+    """Adds deltas to the rollup row for key, creating it if needed."""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    rollup, _ = UsageRollup.objects.get_or_create(**key)
+    UsageRollup.objects.filter(pk=rollup.pk).update(**{field: F(field) + value for field, value in deltas.items()})
+
+def _message_deltas(low, high):
+    # Imported history is not usage and cost no credits.
+    rows = Message.objects.filter(id__gt=low, id__lte=high).exclude(routing='imported').annotate(day=TruncDate('timestamp')).values(
+        'day', 'conversation__user_id', 'backend', 'model_name'
+    ).annotate(
+        user_messages=Count('id', filter=Q(sender='user')),
+        bot_messages=Count('id', filter=Q(sender='bot')),
+        failed_responses=Count('id', filter=Q(sender='bot', text__startswith='Error')),
+        images=Count('id', filter=Q(sender='bot', image__isnull=False) & ~Q(image='')),
+        characters=Sum(Length('text')),
+    )
+    for row in rows:
+        key = {'date': row['day'], 'user_id': row['conversation__user_id'],
+               'backend': row['backend'], 'model_name': row['model_name']}
+        answered = row['bot_messages'] - row['images'] - row['failed_responses']
+        yield key, {
+            'user_messages': row['user_messages'],
+            'bot_messages': row['bot_messages'],
+            'failed_responses': row['failed_responses'],
+            'images': row['images'],
+            'tokens': -(-(row['characters'] or 0) // settings.ROLLUP_CHARS_PER_TOKEN),
+            'credits_spent': answered + IMAGE_CREDITS * row['images'],
+        }
+
+def _reaction_deltas(low, high):
+    rows = ReactionEvent.objects.filter(
+        id__gt=low, id__lte=high, user_id__in=User.objects.values('id')
+    ).annotate(day=TruncDate('created_at')).values('day', 'user_id', 'backend', 'model_name').annotate(
+        reactions_up=Sum('delta', filter=Q(reaction='up'), default=0),
+        reactions_down=Sum('delta', filter=Q(reaction='down'), default=0),
+    )
+    for row in rows:
+        key = {'date': row['day'], 'user_id': row['user_id'],
+               'backend': row['backend'], 'model_name': row['model_name']}
+        yield key, {'reactions_up': row['reactions_up'], 'reactions_down': row['reactions_down']}
+
+def _safe_max_id(rows, time_field, last_id):
+    """
+    The highest id the watermark may move to: that of the newest row older than ROLLUP_SAFETY_LAG.
+
+    Ids are handed out at insert but become visible at commit, so a row with a
+    lower id can appear after higher ones. Stopping at rows that are old enough
+    gives those transactions time to commit before their range is passed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ROLLUP_SAFETY_LAG)
+    return rows.filter(id__gt=last_id, **{f'{time_field}__lt': cutoff}).aggregate(max_id=Max('id'))['max_id'] or 0
+
+def _advance(name, rows, time_field, deltas, batch_size):
+    """Folds the rows past the named watermark into the rollups, one id range per transaction."""
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.get_or_create(name=name)
+            watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+            max_id = _safe_max_id(rows, time_field, watermark.last_id)
+            if max_id <= watermark.last_id:
+                return processed
+            high = min(watermark.last_id + batch_size, max_id)
+            for key, values in deltas(watermark.last_id, high):
+                _apply(key, values)
+            processed += high - watermark.last_id
+            watermark.last_id = high
+            watermark.save(update_fields=['last_id', 'updated_at'])
+
+def update_rollups(batch_size=None):
+    """
+    Folds new messages and reaction events into the usage rollups.
+
+    Only rows past the per-table watermark are read, so each run costs
+    proportionally to what happened since the previous one. The watermark
+    stays ROLLUP_SAFETY_LAG seconds behind the newest rows. Retracted
+    reactions arrive as negative ReactionEvents and are subtracted.
+    Imported messages are skipped.
+
+    Args:
+        batch_size (int, optional): Ids per transaction, ROLLUP_BATCH_SIZE by default.
+
+    Returns:
+        dict: The id range size processed per table.
+    """
+    batch_size = batch_size or settings.ROLLUP_BATCH_SIZE
+    return {
+        # Imported rows carry historical timestamps, they must not move the watermark past live rows.
+        'messages': _advance('messages', Message.objects.exclude(routing='imported'), 'timestamp', _message_deltas, batch_size),
+        'reactions': _advance('reactions', ReactionEvent.objects.all(), 'created_at', _reaction_deltas, batch_size),
+    }
+
+def usage_report(since, user=None, group_by=('backend', 'model_name')):
+    """
+    Sums the rollups from a date on, grouped by the given fields.
+
+    Args:
+        since (date): The first day to include.
+        user (User, optional): Only include this user's usage.
+        group_by (tuple): UsageRollup fields to group by.
+
+    Returns:
+        list: One dict per group with the summed ROLLUP_FIELDS.
+    """
+    rollups = UsageRollup.objects.filter(date__gte=since)
+    if user is not None:
+        rollups = rollups.filter(user=user)
+    return list(
+        rollups.values(*group_by)
+        .annotate(**{field: Sum(field) for field in ROLLUP_FIELDS})
+        .order_by(*group_by)
+    )
@@ -0,0 +1,259 @@
+# chat/routing.py
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from django.core.cache import cache
+
+import threading
+import time
+
+__all__ = ['BackendCall', 'record_latency', 'latency_percentile', 'record_outcome', 'get_backend_health',
+           'rank_backends', 'get_hedge_target', 'hedged_call', 'run_concurrently']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.HEDGE_WORKERS, thread_name_prefix='chat-hedge')
+        return _executor
+
+def _latency_key(backend, model):
+    return f"latency:{backend}:{model}"
+
+def record_latency(backend, model, seconds):
+    """
+    Adds a response time to the rolling latency window of a backend/model.
+
+    Args:
+        backend (str): The backend API, e.g. 'ollama'.
+        model (str): The model or character name.
+        seconds (float): Time until the response was complete.
+    """
+    key = _latency_key(backend, model)
+    samples = cache.get(key, [])
+    samples.append(seconds)
+    cache.set(key, samples[-settings.LATENCY_WINDOW:], None)
+
+def latency_percentile(backend, model, percentile):
+    """
+    Returns a percentile of the recent response times of a backend/model.
+
+    Args:
+        backend (str): The backend API.
+        model (str): The model or character name.
+        percentile (float): The percentile, between 0 and 100.
+
+    Returns:
+        float or None: The latency in seconds, None until enough samples were recorded.
+    """
+    samples = sorted(cache.get(_latency_key(backend, model), []))
+    if len(samples) < settings.HEDGE_MIN_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+    return samples[index]
+
+def _health_key(backend, model):
+    return f"backend_health:{backend}:{model}"
+
+def _decayed_error_rate(health):
+    """Error rate halved every ROUTER_HEALTH_HALF_LIFE seconds without traffic, so idle backends get retried."""
+    idle = time.time() - health.get('updated_at', time.time())
+    return health['error_rate'] * 0.5 ** (idle / settings.ROUTER_HEALTH_HALF_LIFE)
+
+def record_outcome(backend, model, seconds, error):
+    """
+    Updates the rolling health statistics of a backend/model after a request.
+
+    Args:
+        backend (str): The backend API.
+        model (str): The model or character name.
+        seconds (float): Time the request took.
+        error (bool): Whether the request failed.
+
+    Latency and error rate are exponentially weighted moving averages. After
+    ROUTER_FAILURE_THRESHOLD consecutive failures the backend/model is considered
+    down for ROUTER_COOLDOWN seconds.
+    """
+    key = _health_key(backend, model)
+    alpha = settings.ROUTER_EWMA_ALPHA
+    health = cache.get(key) or {'latency': None, 'error_rate': 0.0, 'failures': 0, 'down_until': 0}
+    if not error:
+        health['latency'] = seconds if health['latency'] is None else alpha * seconds + (1 - alpha) * health['latency']
+        health['failures'] = 0
+        health['down_until'] = 0
+    else:
+        health['failures'] += 1
+        if health['failures'] >= settings.ROUTER_FAILURE_THRESHOLD:
+            health['down_until'] = time.time() + settings.ROUTER_COOLDOWN
+    health['error_rate'] = alpha * (1.0 if error else 0.0) + (1 - alpha) * _decayed_error_rate(health)
+    health['updated_at'] = time.time()
+    cache.set(key, health, None)
+
+def get_backend_health(backend, model):
+    """
+    Returns the health statistics of a backend/model.
+
+    Args:
+        backend (str): The backend API.
+        model (str): The model or character name.
+
+    Returns:
+        dict: EWMA 'latency' (None until the first success), 'error_rate',
+        consecutive 'failures' and whether the backend is currently 'down'.
+    """
+    health = cache.get(_health_key(backend, model)) or {'latency': None, 'error_rate': 0.0, 'failures': 0, 'down_until': 0}
+    health['error_rate'] = _decayed_error_rate(health)
+    health['down'] = health['down_until'] > time.time()
+    return health
+
+def _health_score(health):
+    """Expected cost of routing to a backend, lower is better."""
+    if health['down']:
+        return float('inf')
+    latency = health['latency'] if health['latency'] is not None else settings.ROUTER_DEFAULT_LATENCY
+    return latency * (1 + settings.ROUTER_ERROR_PENALTY * health['error_rate'])
+
+def rank_backends(candidates):
+    """
+    Orders candidate backends/models for a request, healthiest first.
+
+    Args:
+        candidates (list): (backend, model) pairs, the user's selection first,
+            followed by the fallbacks the user permitted.
+
+    Returns:
+        list: The same pairs in routing order.
+
+    The user's selection keeps first place unless it is down or another
+    candidate is more than ROUTER_SWITCH_FACTOR times healthier, so routing does
+    not flap between backends with similar latency.
+    """
+    if len(candidates) < 2:
+        return list(candidates)
+    scores = {candidate: _health_score(get_backend_health(*candidate)) for candidate in candidates}
+    selected = candidates[0]
+    ranked = sorted(candidates[1:], key=lambda candidate: scores[candidate])
+    best = ranked[0]
+    if scores[selected] == float('inf') or scores[selected] > settings.ROUTER_SWITCH_FACTOR * scores[best]:
+        return sorted(candidates, key=lambda candidate: scores[candidate])
+    return [selected] + ranked
+
+def get_hedge_target(backend, model):
+    """
+    Looks up the configured equivalent of a backend/model.
+
+    Args:
+        backend (str): The backend API.
+        model (str): The model or character name.
+
+    Returns:
+        tuple or None: (backend, model) of the equivalent, None if none is configured.
+    """
+    target = settings.HEDGE_EQUIVALENTS.get(f"{backend}:{model}") or settings.HEDGE_EQUIVALENTS.get(backend)
+    if not target:
+        return None
+    target_backend, _, target_model = target.partition(':')
+    return target_backend, target_model or model
+
+
+class BackendCall:
+    """
+    One request to a backend/model, timed and cancellable.
+
+    The function receives the call itself and may register cancel hooks on it,
+    e.g. closing its HTTP client, so the losing side of a hedge stops early.
+    """
+
+    def __init__(self, backend, model, func):
+        self.backend = backend
+        self.model = model
+        self.func = func
+        self.cancel_hooks = []
+        self.cancelled = False
+
+    def run(self):
+        """Runs the call and records its latency. Returns the response text."""
+        start = time.monotonic()
+        result = self.func(self)
+        if not self.cancelled:
+            elapsed = time.monotonic() - start
+            error = result.startswith('Error')
+            record_outcome(self.backend, self.model, elapsed, error)
+            if not error:
+                record_latency(self.backend, self.model, elapsed)
+        return result
+
+    def cancel(self):
+        """Stops the call if it is still running."""
+        self.cancelled = True
+        for hook in self.cancel_hooks:
+            try:
+                hook()
+            except Exception:
+                pass
+
+
+def hedged_call(primary, secondary):
+    """
+    Runs a call and hedges it with an equivalent one if it is slow.
+
+    Args:
+        primary (BackendCall): The call to the user's selected backend.
+        secondary (BackendCall): The call to the configured equivalent.
+
+    Returns:
+        tuple: (response text, the BackendCall that produced it).
+
+    The secondary starts once the primary has been running longer than the
+    HEDGE_PERCENTILE of its recent latency, or right away if the primary fails.
+    The first successful answer wins and the other call is cancelled.
+    """
+    delay = latency_percentile(primary.backend, primary.model, settings.HEDGE_PERCENTILE)
+    delay = max(settings.HEDGE_MIN_DELAY, delay if delay is not None else settings.HEDGE_DEFAULT_DELAY)
+
+    executor = _get_executor()
+    calls = {executor.submit(primary.run): primary}
+    done, _ = wait(calls, timeout=delay)
+    if done:
+        future = done.pop()
+        result = future.result()
+        if not result.startswith('Error'):
+            return result, primary
+
+    calls[executor.submit(secondary.run)] = secondary
+    pending = set(future for future in calls if not future.done()) or set(calls)
+    result, winner = None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            text = future.result()
+            if winner is None and not text.startswith('Error'):
+                result, winner = text, calls[future]
+            elif result is None:
+                result = text
+        if winner is not None:
+            break
+
+    for future, call in calls.items():
+        if call is not winner and not future.done():
+            future.cancel()
+            call.cancel()
+    return result, winner or primary
+
+
+def run_concurrently(funcs):
+    """
+    Runs functions in parallel on the routing thread pool.
+
+    Args:
+        funcs (list): Callables without arguments.
+
+    Returns:
+        list: Their return values, in the same order.
+    """
+    executor = _get_executor()
+    return [future.result() for future in [executor.submit(func) for func in funcs]]
@@ -0,0 +1,344 @@
+# chat/semantic.py
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .idempotency import acquire_lock, release_lock
+from .models import Conversation, Message
+from .warmup import ollama_base_url
+
+import json
+import os
+import re
+import shutil
+import zlib
+
+__all__ = ['HashingEmbedder', 'OllamaEmbedder', 'get_embedder', 'SemanticIndex', 'index_user', 'schedule_indexing',
+           'semantic_search', 'compact_index', 'drop_index']
+
+TOKEN_PATTERN = re.compile(r'\w+')
+SEARCH_CHUNK_ROWS = 65536
+
+
+class HashingEmbedder:
+    """
+    Embeds text by hashing words and word pairs into a fixed number of signed buckets.
+
+    Needs no model or service. Similar wording gives similar vectors, which is
+    enough to find a conversation from a few remembered words in any order.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def dimension(self):
+        return self.dim
+
+    def embed(self, texts):
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            features = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+            for feature in features:
+                h = zlib.crc32(feature.encode('utf-8'))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+class OllamaEmbedder:
+    """Embeds text with an Ollama embedding model through /api/embed."""
+
+    def __init__(self, model):
+        self.model = model
+        self.name = f'ollama-{model}'
+
+    def dimension(self):
+        return self.embed(['dimension probe']).shape[1]
+
+    def embed(self, texts):
+        import numpy as np
+        import requests
+
+        response = requests.post(f"{ollama_base_url()}/api/embed", json={'model': self.model, 'input': list(texts)},
+                                 timeout=settings.OLLAMA_WARM_TIMEOUT)
+        response.raise_for_status()
+        return _normalize(np.asarray(response.json()['embeddings'], dtype=np.float32))
+
+
+def _normalize(vectors):
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def get_embedder():
+    """Returns the embedder selected by SEMANTIC_EMBEDDER ("hashing" or "ollama")."""
+    if settings.SEMANTIC_EMBEDDER == 'ollama':
+        return OllamaEmbedder(settings.SEMANTIC_OLLAMA_MODEL)
+    return HashingEmbedder(settings.SEMANTIC_DIM)
+
+
+class SemanticIndex:
+    """
+    Append-only vector index of one user's messages and conversation summaries.
+
+    numpy is imported where it is used, so importing this module stays cheap
+    for views and commands that only schedule indexing. Rows of deleted
+    conversations are removed by compact(), which writes the remaining rows
+    to files of a new generation.
+
+    Files in SEMANTIC_INDEX_DIR/<user id>/:
+        vectors.f32       float32 rows, read through a memory map
+        ids.i64           message id per row, minus the conversation id for summary rows
+        conversations.i64 conversation id per row
+        meta.json         embedder name, dimension, the last indexed message id and the generation
+
+    From the first compaction on, the data files are prefixed with the generation, e.g. 2.vectors.f32.
+    """
+
+    DATA_FILES = ('vectors.f32', 'ids.i64', 'conversations.i64')
+
+    def __init__(self, user_id):
+        self.path = os.path.join(settings.SEMANTIC_INDEX_DIR, str(user_id))
+        self.meta = self._read_meta()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _data_file(self, name, generation=None):
+        if generation is None:
+            generation = self.meta.get('generation', 0) if self.meta else 0
+        return self._file(f'{generation}.{name}' if generation else name)
+
+    def _read_meta(self):
+        try:
+            with open(self._file('meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        tmp = self._file('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._file('meta.json'))
+
+    def reset(self, embedder, dim):
+        os.makedirs(self.path, exist_ok=True)
+        old_files = [self._data_file(name) for name in self.DATA_FILES] if self.meta else []
+        for name in self.DATA_FILES:
+            open(self._file(name), 'wb').close()
+        self.meta = {'embedder': embedder.name, 'dim': dim, 'count': 0, 'last_message_id': 0}
+        self._write_meta()
+        _remove_files(set(old_files) - {self._file(name) for name in self.DATA_FILES})
+
+    def append(self, vectors, ids, conversation_ids, last_message_id=None):
+        """Appends rows and then records them in meta.json, so a crash never exposes half-written rows."""
+        import numpy as np
+
+        with open(self._data_file('vectors.f32'), 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._data_file('ids.i64'), 'ab') as f:
+            f.write(np.asarray(ids, dtype=np.int64).tobytes())
+        with open(self._data_file('conversations.i64'), 'ab') as f:
+            f.write(np.asarray(conversation_ids, dtype=np.int64).tobytes())
+        self.meta['count'] += len(ids)
+        if last_message_id is not None:
+            self.meta['last_message_id'] = last_message_id
+        self._write_meta()
+
+    def ids(self):
+        import numpy as np
+
+        if not self.meta or not self.meta['count']:
+            return np.empty(0, dtype=np.int64)
+        return np.fromfile(self._data_file('ids.i64'), dtype=np.int64, count=self.meta['count'])
+
+    def conversation_ids(self):
+        import numpy as np
+
+        if not self.meta or not self.meta['count']:
+            return np.empty(0, dtype=np.int64)
+        return np.fromfile(self._data_file('conversations.i64'), dtype=np.int64, count=self.meta['count'])
+
+    def compact(self, live_conversation_ids):
+        """
+        Drops the rows of conversations that no longer exist.
+
+        The remaining rows are copied in chunks into files of the next
+        generation, then meta.json is switched over and the old files removed,
+        so searches running meanwhile keep reading a complete index.
+
+        Args:
+            live_conversation_ids (iterable): The user's existing conversations.
+
+        Returns:
+            int: The number of rows removed.
+        """
+        import numpy as np
+
+        conversations = self.conversation_ids()
+        keep = np.isin(conversations, np.fromiter(live_conversation_ids, dtype=np.int64))
+        removed = int(len(keep) - keep.sum())
+        if not removed:
+            return 0
+        count, dim = self.meta['count'], self.meta['dim']
+        generation = self.meta.get('generation', 0) + 1
+        vectors = np.memmap(self._data_file('vectors.f32'), dtype=np.float32, mode='r', shape=(count, dim))
+        ids = self.ids()
+        with open(self._data_file('vectors.f32', generation), 'wb') as f:
+            for start in range(0, count, SEARCH_CHUNK_ROWS):
+                f.write(np.ascontiguousarray(vectors[start:start + SEARCH_CHUNK_ROWS][keep[start:start + SEARCH_CHUNK_ROWS]]).tobytes())
+        with open(self._data_file('ids.i64', generation), 'wb') as f:
+            f.write(ids[keep].tobytes())
+        with open(self._data_file('conversations.i64', generation), 'wb') as f:
+            f.write(conversations[keep].tobytes())
+        del vectors
+        old_files = [self._data_file(name) for name in self.DATA_FILES]
+        self.meta.update(count=count - removed, generation=generation)
+        self._write_meta()
+        _remove_files(old_files)
+        return removed
+
+    def search(self, query_vector, k):
+        """
+        Cosine top-k over the memory-mapped matrix, scanned in chunks to bound memory.
+
+        Returns:
+            list: (score, message or summary id, conversation id), best first.
+        """
+        import numpy as np
+
+        count = self.meta['count'] if self.meta else 0
+        if not count:
+            return []
+        vectors = np.memmap(self._data_file('vectors.f32'), dtype=np.float32, mode='r', shape=(count, self.meta['dim']))
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for start in range(0, count, SEARCH_CHUNK_ROWS):
+            scores = vectors[start:start + SEARCH_CHUNK_ROWS] @ query_vector
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+        order = np.argsort(-best_scores)[:k]
+        ids = np.memmap(self._data_file('ids.i64'), dtype=np.int64, mode='r', shape=(count,))
+        conversations = np.memmap(self._data_file('conversations.i64'), dtype=np.int64, mode='r', shape=(count,))
+        return [(float(best_scores[i]), int(ids[best_rows[i]]), int(conversations[best_rows[i]])) for i in order]
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing semantic index file {path}: {e}")
+
+def index_user(user_id):
+    """
+    Embeds a user's messages and summaries that are not in their index yet,
+    and drops the rows of deleted conversations.
+
+    Args:
+        user_id (int): The user whose index to update.
+
+    Returns:
+        int: The number of rows added.
+    """
+    lock = f'semantic_index_lock:{user_id}'
+    token = acquire_lock(lock, 600)
+    if token is None:
+        return 0
+    try:
+        return _index_user(user_id)
+    finally:
+        release_lock(lock, token)
+
+def _index_user(user_id):
+    import numpy as np
+
+    embedder = get_embedder()
+    index = SemanticIndex(user_id)
+    if index.meta is None or index.meta['embedder'] != embedder.name:
+        index.reset(embedder, embedder.dimension())
+    else:
+        index.compact(Conversation.objects.filter(user_id=user_id).values_list('id', flat=True))
+    added = 0
+    batch_size = settings.SEMANTIC_BATCH_SIZE
+    while True:
+        rows = list(Message.objects.filter(conversation__user_id=user_id, id__gt=index.meta['last_message_id'])
+                    .order_by('id').values_list('id', 'conversation_id', 'text')[:batch_size])
+        if not rows:
+            break
+        last_message_id = rows[-1][0]
+        rows = [row for row in rows if row[2].strip()]
+        vectors = embedder.embed([text for _, _, text in rows]) if rows else np.empty((0, index.meta['dim']))
+        index.append(vectors, [row[0] for row in rows], [row[1] for row in rows], last_message_id=last_message_id)
+        added += len(rows)
+
+    ids = index.ids()
+    indexed = set((-ids[ids < 0]).tolist())
+    pending = [(conversation_id, summary) for conversation_id, summary in
+               Conversation.objects.filter(user_id=user_id, summary__isnull=False).values_list('id', 'summary')
+               if conversation_id not in indexed and summary.strip()]
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        index.append(embedder.embed([summary for _, summary in batch]),
+                     [-conversation_id for conversation_id, _ in batch],
+                     [conversation_id for conversation_id, _ in batch])
+        added += len(batch)
+    return added
+
+def compact_index(user_id):
+    """Queues an index update for a user right away, so rows of just deleted conversations are dropped."""
+    from .tasks import run_in_background
+
+    if settings.SEMANTIC_SEARCH and os.path.exists(os.path.join(settings.SEMANTIC_INDEX_DIR, str(user_id))):
+        run_in_background(index_user, user_id)
+
+def drop_index(user_id):
+    """Removes a user's index, for example after all their conversations were deleted."""
+    shutil.rmtree(os.path.join(settings.SEMANTIC_INDEX_DIR, str(user_id)), ignore_errors=True)
+
+def schedule_indexing(user_id):
+    """Queues a background index update for a user, at most one per SEMANTIC_INDEX_INTERVAL."""
+    from .tasks import run_in_background
+
+    if settings.SEMANTIC_SEARCH and cache.add(f'semantic_index:{user_id}', True, settings.SEMANTIC_INDEX_INTERVAL):
+        run_in_background(index_user, user_id)
+
+def semantic_search(user_id, query, limit=None):
+    """
+    Finds a user's conversations by meaning.
+
+    Args:
+        user_id (int): The owner of the conversations.
+        query (str): The search text.
+        limit (int, optional): Maximum number of conversations, SEMANTIC_TOP_K by default.
+
+    Returns:
+        list: (conversation id, score, [matching message ids]) tuples, best first.
+    """
+    limit = limit or settings.SEMANTIC_TOP_K
+    index = SemanticIndex(user_id)
+    if not index.meta or not index.meta['count']:
+        return []
+    embedder = get_embedder()
+    if embedder.name != index.meta['embedder']:
+        return []
+    query_vector = embedder.embed([query])[0]
+    results = {}
+    for score, item_id, conversation_id in index.search(query_vector, limit * 5):
+        if score <= settings.SEMANTIC_MIN_SCORE:
+            break
+        entry = results.setdefault(conversation_id, [score, []])
+        if item_id > 0 and len(entry[1]) < 3:
+            entry[1].append(item_id)
+    ranked = sorted(results.items(), key=lambda item: -item[1][0])[:limit]
+    return [(conversation_id, score, message_ids) for conversation_id, (score, message_ids) in ranked]
@@ -0,0 +1,125 @@
+# chat/serializers.py
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.http import HttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.decorators import decorator_from_middleware
+from django.utils.encoding import filepath_to_uri
+
+from .models import MessageReaction
+
+from functools import lru_cache
+import json
+
+__all__ = ['format_timestamp', 'format_timestamps', 'media_url', 'reaction_summary', 'dumps',
+           'FastJsonResponse', 'gzip_large']
+
+
+def format_timestamp(value):
+    """Formats a datetime as 'YYYY-MM-DD HH:MM:SS', like strftime but several times faster."""
+    return value.isoformat(' ', 'seconds')[:19]
+
+def format_timestamps(rows, *fields):
+    """
+    Formats datetime fields of values() rows in place.
+
+    Args:
+        rows (list): Row dicts.
+        *fields (str): The datetime fields, 'timestamp' by default.
+
+    Returns:
+        list: The same rows.
+    """
+    for field in fields or ('timestamp',):
+        for row in rows:
+            row[field] = row[field].isoformat(' ', 'seconds')[:19]
+    return rows
+
+def media_url(name):
+    """
+    Returns the URL of a stored image from its name.
+
+    For the file system storage the URL is built from MEDIA_URL directly,
+    without the storage's url() call per row.
+
+    Args:
+        name (str): The storage name, may be empty.
+
+    Returns:
+        str or None: The URL, None without an image.
+    """
+    if not name:
+        return None
+    if isinstance(default_storage, FileSystemStorage):
+        return default_storage.base_url + filepath_to_uri(name).lstrip('/')
+    return default_storage.url(name)
+
+def reaction_summary(message_ids, user):
+    """
+    Loads reaction counts and the user's own reactions for many messages in two queries.
+
+    Args:
+        message_ids (list): The messages.
+        user (User): Whose reactions to return.
+
+    Returns:
+        tuple: {message id: {'up': int, 'down': int}} and {message id: reaction}.
+    """
+    counts = {message_id: {'up': 0, 'down': 0} for message_id in message_ids}
+    rows = MessageReaction.objects.filter(message_id__in=message_ids).values('message_id', 'reaction').annotate(total=Count('id'))
+    for row in rows.order_by():
+        counts[row['message_id']][row['reaction']] = row['total']
+    own = dict(MessageReaction.objects.filter(message_id__in=message_ids, user=user).values_list('message_id', 'reaction'))
+    return counts, own
+
+@lru_cache(maxsize=1)
+def _orjson():
+    """orjson if it is installed, else None."""
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+def _default(value):
+    return DjangoJSONEncoder().default(value)
+
+def dumps(data):
+    """
+    Encodes data as compact JSON, with orjson when it is installed (pip install orjson).
+
+    Args:
+        data: Anything JsonResponse accepts.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    orjson = _orjson()
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """A JsonResponse encoded with dumps()."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class LargeResponseGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves responses below JSON_GZIP_MIN_BYTES uncompressed."""
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.JSON_GZIP_MIN_BYTES:
+            return response
+        return super().process_response(request, response)
+
+
+# Compresses a view's response when the client accepts gzip. Put it above @etag so
+# the ETag of a compressed response is weakened.
+gzip_large = decorator_from_middleware(LargeResponseGZipMiddleware)
@@ -0,0 +1,209 @@
+# chat/serving.py
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .cleanup import GENERATED_IMAGES_DIR
+
+from functools import lru_cache
+from stat import S_ISREG
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+
+__all__ = ['parse_range', 'serve_static', 'serve_media']
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class RangeFile:
+    """Reads at most length bytes of an open file from its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range Range header.
+
+    Args:
+        header (str): The Range header value.
+        size (int): The size of the file in bytes.
+
+    Returns:
+        tuple or None: Inclusive (start, end) offsets, None to send the whole file.
+
+    Raises:
+        ValueError: If the range lies outside the file.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        # Multiple ranges and malformed headers may be ignored (RFC 9110).
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if end < start and last:
+            return None
+    else:
+        if not int(last):
+            raise ValueError('Empty suffix range.')
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size:
+        raise ValueError('Range starts after the end of the file.')
+    return start, end
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        try:
+            if params.startswith('q=') and not float(params[2:]):
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+def _file_response(request, path, cache_control, encodings=(), accel_redirect=None):
+    """
+    Builds a cached, conditional and range-aware response for a file on disk.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        path (str): The absolute path of the file.
+        cache_control (str): The Cache-Control header value.
+        encodings (tuple): (Content-Encoding, suffix) pairs of precompressed variants to try, best first.
+        accel_redirect (str, optional): Internal nginx location to hand the file to.
+
+    Returns:
+        HttpResponse: The file, a 206 slice of it, a 304 or a 416.
+    """
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    encoding = None
+    if encodings:
+        accepted = _accepted_encodings(request)
+        for coding, suffix in encodings:
+            if coding in accepted and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, coding
+                break
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise Http404('File not found.')
+    if not S_ISREG(stat.st_mode):
+        raise Http404('File not found.')
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    headers = {'ETag': etag, 'Last-Modified': http_date(stat.st_mtime), 'Cache-Control': cache_control}
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None and accel_redirect:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_redirect
+    elif response is None:
+        try:
+            byte_range = None if encoding else parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        file = open(path, 'rb')
+        if byte_range:
+            start, end = byte_range
+            file.seek(start)
+            response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            # A whole open file goes to wsgi.file_wrapper, which uses sendfile() where available.
+            response = FileResponse(file, content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        else:
+            response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    if encodings:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+@lru_cache(maxsize=1)
+def _hashed_static_names():
+    """The content-hashed names from the staticfiles manifest, empty without manifest storage."""
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+@require_safe
+def serve_static(request, path):
+    """
+    Serves a collected static file, for deployments without a web server in front.
+
+    Precompressed .br/.gz variants written by collectstatic are picked by
+    Accept-Encoding. Fingerprinted names are cached for a year, the rest
+    are revalidated with their ETag.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        path (str): The path below STATIC_URL.
+
+    Returns:
+        HttpResponse: The file.
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found.')
+    cache_control = IMMUTABLE if path in _hashed_static_names() else 'public, no-cache'
+    return _file_response(request, full_path, cache_control, encodings=ENCODINGS)
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serves a generated image.
+
+    Only files under GENERATED_IMAGES_DIR are served, the rest of MEDIA_ROOT
+    is not public. With MEDIA_ACCEL_REDIRECT set the file is handed to nginx through
+    X-Accel-Redirect. Otherwise it is sent with FileResponse, with Range
+    support. Image names are unique, so responses are cached for a year.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        path (str): The path below MEDIA_URL.
+
+    Returns:
+        HttpResponse: The file.
+    """
+    if not path.startswith(f"{GENERATED_IMAGES_DIR}/"):
+        raise Http404('File not found.')
+    try:
+        # Joined below the images directory, so "generated_images/../" cannot leave it.
+        full_path = safe_join(os.path.join(settings.MEDIA_ROOT, GENERATED_IMAGES_DIR), path[len(GENERATED_IMAGES_DIR) + 1:])
+    except SuspiciousFileOperation:
+        raise Http404('File not found.')
+    accel_redirect = None
+    if settings.MEDIA_ACCEL_REDIRECT:
+        accel_redirect = settings.MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + quote(path)
+    return _file_response(request, full_path, IMMUTABLE, accel_redirect=accel_redirect)
@@ -0,0 +1,72 @@
+# chat/storage.py
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+import gzip
+import os
+
+__all__ = ['CompressedManifestStaticFilesStorage', 'compress_file']
+
+
+def compress_file(path):
+    """
+    Writes .gz and, if the brotli package is installed, .br variants next to a file.
+
+    Variants that would not be smaller than the original are not written.
+
+    Args:
+        path (str): The absolute path of the file.
+
+    Returns:
+        list: The paths of the variants written.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    except ImportError:
+        pass
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also precompresses the collected files.
+
+    collectstatic writes content-hashed copies (main.3f2a1c.css) that
+    serve_static marks as immutable, and gzip/brotli variants of text
+    assets so they are never compressed per request.
+    """
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                # Vendored bundles (tailwind.css is the Tailwind play script) contain
+                # url(...) text that is code, not a file reference. Leave it alone.
+                return matchobj.group(0)
+        return convert
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = set()
+        for name, hashed_name, result in super().post_process(paths, dry_run, **options):
+            processed.add(name)
+            yield name, hashed_name, result
+        if dry_run:
+            return
+        for name in processed:
+            for stored in {name, self.stored_name(name)}:
+                if os.path.splitext(stored)[1].lower() in settings.STATIC_COMPRESS_EXTENSIONS:
+                    compress_file(self.path(stored))
@@ -0,0 +1,52 @@
+# chat/tasks.py
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from django.conf import settings
+from django.db import close_old_connections
+
+import threading
+
+__all__ = ['run_in_background']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_TASK_WORKERS,
+                thread_name_prefix='chat-task',
+            )
+        return _executor
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Runs a function on the background thread pool.
+
+    Args:
+        func (callable): The job to run.
+        *args: Positional arguments for the job.
+        **kwargs: Keyword arguments for the job.
+
+    Returns:
+        Future: Resolves to the job's return value, or None if it failed.
+
+    Errors are printed rather than raised, the same way ModelSyncThread reports them.
+    """
+    def job():
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            print(f"Error in background task {func.__name__}: {e}")
+        finally:
+            close_old_connections()
+
+    if settings.BACKGROUND_TASKS_EAGER:
+        future = Future()
+        future.set_result(func(*args, **kwargs))
+        return future
+    return _get_executor().submit(job)
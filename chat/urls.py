@@ -4,8 +4,6 @@ from . import views
 
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('login/', views.custom_login, name='login'),
@@ -20,11 +18,16 @@ urlpatterns = [
     path('ajax/delete_all_conversations/', views.delete_all_conversations, name='delete_all_conversations'),
     path('ajax/delete_user_account/', views.delete_user_account, name='delete_user_account'),
     path('ajax/export/', views.export_all_conversations, name='export_all_conversations'),
+    path('ajax/import/', views.import_all_conversations, name='import_all_conversations'),
+    path('ajax/import_status/', views.get_import_status, name='get_import_status'),
     path('ajax/generate_image/', views.generate_image, name='generate_image'),
     path('ajax/get_prompts/', views.get_prompts, name='get_prompts'),
+    path('ajax/get_prompt_content/', views.get_prompt_content, name='get_prompt_content'),
     path('ajax/regenerate_response/', views.regenerate_response, name='regenerate_response'),
+    path('ajax/select_variant/', views.select_variant, name='select_variant'),
     path('ajax/toggle_reaction/', views.toggle_reaction, name='toggle_reaction'),
     path('ajax/search_conversations/', views.search_conversations, name='search_conversations'),
     path('ajax/get_message_id/', views.get_message_id, name='get_message_id'),
+    path('ajax/usage_report/', views.get_usage_report, name='usage_report'),
     path('conversations/<uuid:uuid>/', views.public_conversation_view, name='public_conversation'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
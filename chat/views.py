@@ -1,40 +1,60 @@
 # chat/views.py
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate, update_session_auth_hash
+from django.template.loader import render_to_string
+from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, etag
+from django.views.decorators.cache import cache_control
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.core.files.base import ContentFile
-from django.db.models import Q
+from django.http import JsonResponse, HttpResponse, Http404
+from django.db.models import Q, Max, Count
+from django.db import transaction
 from django.core.cache import cache
 from django.conf import settings
 from django.urls import reverse
-
-from .models import Conversation, Message, Credits, Prompt, MessageReaction
+from django.utils import timezone
+
+from .models import Conversation, Message, Prompt, MessageReaction, ImportJob
+from .cache import bump_version, cached, get_version
+from .cleanup import delete_conversations, delete_user
+from .archive import archived_conversation_of_message, load_archived_messages, restore_conversation, search_archived_conversations
+from .importer import import_storage, run_import_job
+from .rollups import IMAGE_CREDITS, record_reaction_event, usage_report
+from .semantic import schedule_indexing, semantic_search
+from .rendering import archived_message_html, ensure_rendered, ensure_rendered_rows, rendered_fields
+from .serializers import FastJsonResponse, format_timestamp, format_timestamps, gzip_large, media_url, reaction_summary
+from .prompts import get_prompt_index
+from .replicas import use_replica
+from .idempotency import LockTimeout, conversation_lock, idempotent
+from .imagebatch import DEFAULT_PARAMS, image_batcher
+from .imagecache import generation_key, is_cacheable, store_image, cached_image, remember_image
+from .routing import BackendCall, get_hedge_target, hedged_call, rank_backends, record_latency, record_outcome, run_concurrently
+from .tasks import run_in_background
+from .warmup import keep_model_alive, warm_selected_model
+from .backends import openai_client
+from .qr import otp_qr_code_base64
 from .forms import CustomPasswordChangeForm, OTPEnableForm, CustomAuthenticationForm, BackendAPIChoiceForm
 
-import os
-from openai import OpenAI
 import requests
 import json
-import pyotp
-import qrcode
-from io import BytesIO
-import base64
 import uuid
 import socket
 from urllib.parse import urlparse
 from functools import wraps
 import time
+import hashlib
+from datetime import timedelta
 
 
 ooba_url =  settings.OOBA_URL
 img_url = settings.SD_URL
 ollama_url = settings.OLLAMA_URL
 
+# Reciprocal rank fusion constant for merging keyword and semantic search results.
+SEARCH_RRF_K = 60
+
 # ==============================================================================
 # Section 1: Utility Functions
 # ==============================================================================
@@ -75,6 +95,91 @@ def rate_limit(key, limit, period):
         return wrapped_view
     return decorator
 
+def get_user_conversations(user):
+    """
+    Returns the serialized conversation list of a user through the cache.
+
+    Args:
+        user (User): The owner of the conversations.
+
+    Returns:
+        list: Conversation dicts, newest first.
+    """
+    def load():
+        conversations = Conversation.objects.filter(user=user).order_by('-created_at').values_list('id', 'uuid', 'created_at', 'summary')
+        return [
+            {
+                'id': conv_id,
+                'uuid': str(conv_uuid),
+                'created_at': format_timestamp(created_at),
+                'summary': summary,
+            } for conv_id, conv_uuid, created_at, summary in conversations
+        ]
+    return cached('conversations', user.id, load)
+
+def make_etag(*markers):
+    """Builds a strong ETag value from cheap version markers."""
+    return hashlib.sha1(':'.join(str(marker) for marker in markers).encode()).hexdigest()
+
+def messages_etag(request):
+    """
+    ETag of get_messages, from the last message id and the message/reaction versions.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        str or None: The ETag, or None to let the view answer unknown conversations.
+    """
+    conversation_id = request.GET.get('conversation_id')
+    if not request.user.is_authenticated or not conversation_id or not conversation_id.isdigit():
+        return None
+    row = Conversation.objects.filter(id=conversation_id, user=request.user).annotate(
+        last_message_id=Max('messages__id')
+    ).values_list('id', 'last_message_id').first()
+    if row is None:
+        return None
+    return make_etag(
+        'messages', request.user.id, conversation_id, row[1],
+        get_version('conversation', conversation_id), get_version('reactions', conversation_id),
+    )
+
+def conversations_etag(request):
+    """ETag of get_conversations, from the user's conversation list version."""
+    if not request.user.is_authenticated:
+        return None
+    return make_etag('conversations', request.user.id, get_version('conversations', request.user.id))
+
+def prompts_etag(request):
+    """ETag of get_prompts, from the prompt table's size and latest update and the search parameters."""
+    stats = Prompt.objects.aggregate(last_update=Max('updated_at'), total=Count('id'))
+    return make_etag(
+        'prompts', stats['total'], stats['last_update'].isoformat() if stats['last_update'] else '',
+        request.GET.get('q', ''), request.GET.get('limit', ''),
+    )
+
+def get_public_conversation_id(uuid):
+    """
+    Resolves a public conversation UUID to its id, through the cache.
+
+    Only found ids are cached, so a UUID that does not exist yet is looked up
+    again next time instead of returning 404 until the entry expires.
+    """
+    key = f"public_conversation_id:{uuid}"
+    conversation_id = cache.get(key)
+    if conversation_id is None:
+        conversation_id = Conversation.objects.filter(uuid=uuid).values_list('id', flat=True).first()
+        if conversation_id is not None:
+            cache.set(key, conversation_id, settings.PUBLIC_PAGE_CACHE_TIMEOUT)
+    return conversation_id
+
+def public_conversation_etag(request, uuid):
+    """ETag of a public conversation page, from the conversation version."""
+    conversation_id = get_public_conversation_id(uuid)
+    if conversation_id is None:
+        return None
+    return make_etag('public', uuid, get_version('conversation', conversation_id))
+
 def check_api_status(url):
     """
     Checks the status of a given API by attempting a socket connection.
@@ -111,102 +216,157 @@ def check_img_api_status():
 # Section 2: External API Integrations
 # ==============================================================================
     
-def send_to_openai(conversation, credits_object, backend_api):
+BACKEND_MODEL_LABELS = {
+    'openai': 'OpenAI model',
+    'ollama': 'Ollama model',
+    'nebius': 'Nebius model',
+    'oobabooga': 'Oobabooga character',
+}
+
+def get_route_candidates(context):
     """
-    Sends conversation to the routed backend using the OpenAI library.
+    Lists the backend/model pairs a request may be routed to.
+
+    Args:
+        context (UserContext): The requesting user's context.
+
+    Returns:
+        tuple: The (backend, model) candidates, the selected one first, and an
+        error message if the selected backend cannot be used.
+    """
+    backend_api = context.backend_api
+    if backend_api not in BACKEND_MODEL_LABELS:
+        return [], 'Error: Unsupported backend API.'
+    selected_model = context.selected_model(backend_api)
+    if not selected_model:
+        return [], f'Error: No {BACKEND_MODEL_LABELS[backend_api]} selected.'
+
+    candidates = [(backend_api, selected_model)]
+    for fallback in context.fallback_backends:
+        fallback_model = context.selected_model(fallback)
+        if fallback != backend_api and fallback_model:
+            candidates.append((fallback, fallback_model))
+    return candidates, None
+
+def build_history(conversation):
+    """
+    Returns the active messages of the conversation as chat messages, oldest first.
+
+    The list starts with CHAT_SYSTEM_PROMPT (if set) and messages are ordered
+    by timestamp and id with their text unchanged, so each request repeats the
+    previous one byte for byte before appending. That keeps provider prompt
+    caches and llama.cpp KV reuse hitting.
+    """
+    messages = conversation.messages.filter(is_active=True).order_by('timestamp', 'id').values_list('sender', 'text')
+    history = [{'role': 'system', 'content': settings.CHAT_SYSTEM_PROMPT}] if settings.CHAT_SYSTEM_PROMPT else []
+    history.extend(
+        {'role': 'user' if sender == 'user' else 'assistant', 'content': text}
+        for sender, text in messages
+    )
+    return history
+
+def send_to_openai(backend_api, model, history, call=None):
+    """
+    Sends a chat history to an OpenAI-compatible backend using the OpenAI library.
 
     Args:
-        conversation (Conversation): The conversation object.
-        credits_object (Credits): The user's credits object.
         backend_api (str): The chosen backend API openAI,Nebius or Ollama.
+        model (str): The model name.
+        history (list): The chat messages.
+        call (BackendCall, optional): Registers the client so the request can be cancelled.
 
     Returns:
         str: Assistant's response or an error message.
     """
-    profile = conversation.user.profile
-
-    if backend_api == 'openai':
-        api_key = os.getenv("OPENAI_API_KEY")
-        url = "https://api.openai.com/v1/"
-        selected_model = profile.selected_openai_model.name if profile.selected_openai_model else None
-        if not selected_model:
-            return 'Error: No OpenAI model selected.'
-    elif backend_api == 'ollama':
-        api_key = "ollama"
-        url = "http://localhost:11434/v1"
-        selected_model = profile.selected_ollama_model.name if profile.selected_ollama_model else None
-        if not selected_model:
-            return 'Error: No Ollama model selected.'
-    elif backend_api == 'nebius':
-        api_key = os.getenv("NEBIUS_API_KEY")
-        url = "https://api.studio.nebius.ai/v1/"
-        selected_model = profile.selected_model.name if profile.selected_model else None
-        if not selected_model:
-            return 'Error: No Nebius model selected.'
-
-    openai_client = OpenAI(base_url = url, api_key = api_key)
-    messages = conversation.messages.order_by('timestamp')
-    history = []
-
-    for msg in messages:
-        role = 'user' if msg.sender == 'user' else 'assistant'
-        history.append({'role': role, 'content': msg.text})
-    print(history)
+    client = openai_client(backend_api)
+    if call:
+        call.cancel_hooks.append(client.close)
     try:
-        response = openai_client.chat.completions.create(
-            model=selected_model,
+        response = client.chat.completions.create(
+            model=model,
             messages=history,
         )
-        assistant_message = response.choices[0].message.content.strip()
-        credits_object.credits -= 1
-        credits_object.save()
-        return assistant_message
+        if backend_api == 'ollama':
+            keep_model_alive(model)
+        return response.choices[0].message.content.strip()
     except Exception as e:
         return f'Error: {str(e)}'
-    
-def send_to_oobabooga(conversation, credits_object):
+
+def send_to_openai_choices(backend_api, model, history, n):
     """
-    Sends conversation to the Oobabooga API and retrieves the assistant's response.
+    Asks an OpenAI-compatible backend for several answers in one request.
 
     Args:
-        conversation (Conversation): The conversation object.
-        credits_object (Credits): The user's credits object.
+        backend_api (str): A backend from settings.BACKENDS_SUPPORTING_N.
+        model (str): The model name.
+        history (list): The chat messages.
+        n (int): The number of answers.
+
+    Returns:
+        list: The answers, or a single error message.
+    """
+    client = openai_client(backend_api)
+    start = time.monotonic()
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=history,
+            n=n,
+        )
+        texts = [(choice.message.content or '').strip() for choice in response.choices]
+        if not texts:
+            texts = ['Error: The backend returned no choices.']
+    except Exception as e:
+        texts = [f'Error: {str(e)}']
+    elapsed = time.monotonic() - start
+    failed = texts[0].startswith('Error')
+    record_outcome(backend_api, model, elapsed, failed)
+    if not failed:
+        record_latency(backend_api, model, elapsed)
+    return texts
+
+def send_to_oobabooga(character, history, call=None):
+    """
+    Sends a chat history to the Oobabooga API and retrieves the assistant's response.
+
+    Args:
+        character (str): The Oobabooga character.
+        history (list): The chat messages.
+        call (BackendCall, optional): Registers the session so the request can be cancelled.
 
     Returns:
         str: Assistant's response or an error message.
     """
     headers = {'Content-Type': 'application/json',}
-    messages = conversation.messages.order_by('timestamp')
-    history = []
-
-    for msg in messages:
-        role = 'user' if msg.sender == 'user' else 'assistant'
-        history.append({'role': role, 'content': msg.text})
-    profile = conversation.user.profile
-    selected_character = profile.selected_character.name if profile.selected_character else None
-    if not selected_character:
-        return 'Error: No Oobabooga character selected.'
     data = {
         'messages': history,
         'mode': 'chat',
-        'character': selected_character,
+        'character': character,
         "temperature": 0.7,
         "max_tokens": 250,
         "top_p": 0.85,
         "frequency_penalty": 0.35,
     }
+    session = requests.Session()
+    if call:
+        call.cancel_hooks.append(session.close)
     try:
-        response = requests.post(ooba_url, headers=headers, json=data)
+        response = session.post(ooba_url, headers=headers, json=data)
         if response.status_code == 200:
             response_json = response.json()
-            assistant_message = response_json['choices'][0]['message']['content']
-            credits_object.credits -= 1
-            credits_object.save()
-            return assistant_message
+            return response_json['choices'][0]['message']['content']
         else:
             return 'Error: Could not get response from AI.'
     except Exception as e:
         return f'Error: {str(e)}'
+    finally:
+        session.close()
+
+def make_backend_call(backend_api, model, history):
+    """Wraps a request to a backend/model in a timed, cancellable BackendCall."""
+    if backend_api == 'oobabooga':
+        return BackendCall(backend_api, model, lambda call: send_to_oobabooga(model, history, call))
+    return BackendCall(backend_api, model, lambda call: send_to_openai(backend_api, model, history, call))
     
 def generate_summary(user_message, assistant_message):
     """
@@ -219,10 +379,10 @@ def generate_summary(user_message, assistant_message):
     Returns:
         str: Summary of the conversation.
     """
-    openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = openai_client('openai')
     prompt = f"Summarize the following conversation between a user and an assistant in 10 words maximum:\n\nUser: {user_message}\nAssistant: {assistant_message}\n\nSummary:"
     try:
-        completion = openai_client.chat.completions.create(
+        completion = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that summarizes conversations."},
@@ -236,68 +396,142 @@ def generate_summary(user_message, assistant_message):
         print(f"Error generating summary: {e}")
         return "No summary available."
 
-def generate_image_from_prompt(prompt):
+def generate_image_from_prompt(prompt, params=None):
     """
     Generates an image based on the provided prompt using the StableDiffusion API.
 
+    Concurrent requests are micro-batched into shared txt2img calls, see chat/imagebatch.py.
+
     Args:
         prompt (str): The text prompt for image generation.
+        params (dict, optional): txt2img parameters, DEFAULT_PARAMS by default.
 
     Returns:
         bytes or None: The generated image in bytes or None if failed.
     """
-    payload = {
-        "prompt": prompt,
-        "steps": 20,
-        "cfg_scale": 5,
-        "width": 512,
-        "height": 512,
-        "send_images": True,
-        "save_images": False,
-    }
+    return image_batcher.generate(prompt, params)
 
-    try:
-        response = requests.post(img_url, json=payload)
-        if response.status_code == 200:
-            response_data = response.json()
-            images = response_data.get('images', [])
-            if images:
-                image_data = images[0]
-                if "," in image_data:
-                    base64_data = image_data.split(",", 1)[1]
-                else:
-                    base64_data = image_data
-                image = base64.b64decode(base64_data)
-                return image
-        else:
-            print("API error:", response.text)
-            return None
-    except Exception as e:
-        print(f"Error generating image: {e}")
+def generated_image_name(prompt, params):
+    """
+    Returns the stored image for a prompt, generating it only on an image cache miss.
+
+    Args:
+        prompt (str): The text prompt for image generation.
+        params (dict): txt2img parameters.
+
+    Returns:
+        str or None: The storage name of the image or None if generation failed.
+    """
+    cacheable = is_cacheable(params)
+    if cacheable:
+        key = generation_key(prompt, params)
+        name = cached_image(key)
+        if name:
+            return name
+    image = generate_image_from_prompt(prompt, params)
+    if not image:
         return None
-    
-def send_to_backend(conversation, credits_object, backend_api):
+    name = store_image(image)
+    # The batcher renders a fixed seed exactly (it never batches seeded requests),
+    # and any sample is a valid result for seed -1, so the image matches the key.
+    if cacheable:
+        remember_image(key, name, len(image))
+    return name
+
+def send_to_backend(conversation, context):
     """
-    Routes the conversation to the selected backend API.
+    Routes the conversation to the healthiest permitted backend API.
+
+    The selected backend is tried first unless it is down or much slower than
+    one of the fallbacks the user permitted. Failed requests fail over to the
+    next candidate. Users who enabled request hedging also get the configured
+    equivalent backend when the first choice is slow, see chat.routing.hedged_call.
+    Credits are charged once, for the answer that is used.
 
     Args:
         conversation (Conversation): The conversation object.
-        credits_object (Credits): The user's credits object.
-        backend_api (str): The chosen backend API.
+        context (UserContext): The requesting user's context.
 
     Returns:
-        str: Assistant's response or an error message.
+        tuple: The assistant's response or an error message, and the routing
+        decision as Message field values (backend, model_name, routing).
     """
-    if backend_api == 'oobabooga':
-        return send_to_oobabooga(conversation, credits_object)
-    elif backend_api == 'nebius':
-        return send_to_openai(conversation, credits_object, backend_api)
-    elif backend_api == 'ollama':
-        return send_to_openai(conversation, credits_object, backend_api)
-    elif backend_api == 'openai':
-        return send_to_openai(conversation, credits_object, backend_api)
-    else:
-        return 'Error: Unsupported backend API.'
+    candidates, error = get_route_candidates(context)
+    if error:
+        return error, {}
+
+    history = build_history(conversation)
+    response_text, route = None, {}
+    for attempt, (backend, model) in enumerate(rank_backends(candidates)):
+        call = make_backend_call(backend, model, history)
+        hedge_target = get_hedge_target(backend, model) if context.hedge_requests and attempt == 0 else None
+        if hedge_target:
+            response_text, call = hedged_call(call, make_backend_call(*hedge_target, history))
+        else:
+            response_text = call.run()
+
+        if call.backend != backend:
+            routing = 'hedged'
+        elif attempt > 0:
+            routing = 'failover'
+        elif (backend, model) != candidates[0]:
+            routing = 'routed'
+        else:
+            routing = 'selected'
+        route = {'backend': call.backend, 'model_name': call.model, 'routing': routing}
+        if not response_text.startswith('Error'):
+            break
+
+    if not response_text.startswith('Error'):
+        context.charge(1)
+    return response_text, route
+
+def generate_candidates(conversation, context, count):
+    """
+    Generates several alternative answers to the last user message at once.
+
+    Backends listed in settings.BACKENDS_SUPPORTING_N return all candidates
+    from a single request through the `n` parameter, the others get one
+    request per candidate, sent concurrently. Each successful candidate costs
+    one credit, so count is capped by the credits left.
+
+    Args:
+        conversation (Conversation): The conversation object.
+        context (UserContext): The requesting user's context.
+        count (int): The number of candidates wanted.
+
+    Returns:
+        tuple: The successful answers (or a single error message) and the
+        routing decision as Message field values.
+    """
+    candidates, error = get_route_candidates(context)
+    if error:
+        return [error], {}
+
+    count = max(1, min(count, context.credits))
+    history = build_history(conversation)
+    while history and history[-1]['role'] == 'assistant':
+        history.pop()
+    texts, route = [], {}
+    for attempt, (backend, model) in enumerate(rank_backends(candidates)):
+        if backend in settings.BACKENDS_SUPPORTING_N:
+            texts = send_to_openai_choices(backend, model, history, count)
+        else:
+            calls = [make_backend_call(backend, model, history) for _ in range(count)]
+            texts = run_concurrently([call.run for call in calls])
+
+        if attempt > 0:
+            routing = 'failover'
+        elif (backend, model) != candidates[0]:
+            routing = 'routed'
+        else:
+            routing = 'selected'
+        route = {'backend': backend, 'model_name': model, 'routing': routing}
+        answers = [text for text in texts if not text.startswith('Error')]
+        if answers:
+            context.charge(len(answers))
+            return answers, route
+    return texts[:1], route
 # ==============================================================================
 # Section 3: View Functions
 # ==============================================================================
@@ -313,10 +547,8 @@ def chat_view(request):
         HttpResponse: Rendered chat page.
     """
     user = request.user
-    conversations = Conversation.objects.filter(user=request.user).order_by('-created_at')
-    if not Credits.objects.filter(user=user).exists():
-        Credits.objects.create(user=user, credits=500)
-    credits = Credits.objects.get(user=request.user).credits
+    conversations = get_user_conversations(user)
+    credits = request.user_context.credits
     initials = user.username[:2].upper()
     ooba_api_status = check_ooba_api_status()
     img_api_status = check_img_api_status()
@@ -324,18 +556,22 @@ def chat_view(request):
     return render(request, 'chat.html', {'conversations': conversations,'credits': credits,'initials': initials,'ooba_api_status': ooba_api_status,'ollama_api_status':ollama_api_status,'img_api_status': img_api_status})
 
 @login_required
+@idempotent('send_message')
 def send_message(request):
     """
     Handles sending a user message, interacting with the backend AI, and saving the response.
 
+    Messages to the same conversation are handled one at a time, and retries
+    that carry the same Idempotency-Key get the first response back.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
         JsonResponse: Contains the assistant's response, conversation ID, and summary.
     """
-    credits = Credits.objects.get(user=request.user)
-    if credits.credits <= 0:
+    context = request.user_context
+    if context.credits <= 0:
         return JsonResponse({'error': 'You have no credits left. Please buy more credits to continue.'}, status=400)
     else:
         if request.method == 'POST':
@@ -349,38 +585,91 @@ def send_message(request):
 
                 if conversation_id and conversation_id != 'null':
                     conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+                    if conversation.archived:
+                        restore_conversation(conversation)
                 else:
                     conversation = Conversation.objects.create(user=request.user)
 
-                Message.objects.create(conversation=conversation, sender='user', text=user_message)
-                backend_api = request.user.profile.backend_api_choice
-                response_text = send_to_backend(conversation, credits, backend_api)
+                with conversation_lock(conversation.id):
+                    user_msg = Message.objects.create(conversation=conversation, sender='user', text=user_message)
+                    response_text, route = send_to_backend(conversation, context)
 
-                bot_message = Message.objects.create(conversation=conversation, sender='bot', text=response_text)
+                    bot_message = Message.objects.create(conversation=conversation, sender='bot', text=response_text,
+                                                         parent=user_msg, **route, **rendered_fields(response_text))
 
-                if conversation.messages.count() == 2:
-                    summary = generate_summary(user_message, response_text)
-                    conversation.summary = summary
-                    conversation.save()
-                else:
-                    summary = conversation.summary or ''
+                    if conversation.messages.count() == 2:
+                        summary = generate_summary(user_message, response_text)
+                        conversation.summary = summary
+                        conversation.save()
+                    else:
+                        summary = conversation.summary or ''
+                schedule_indexing(request.user.id)
 
                 return JsonResponse({
                     'response': response_text, 
+                    'html': bot_message.html,
                     'conversation_id': conversation.id, 
                     'summary': summary,
                     'message_id': bot_message.id,
                     'reaction_counts': bot_message.reaction_counts,
                     'user_reaction': None
                 })
+            except LockTimeout:
+                return JsonResponse({'error': 'This conversation is busy with another message.'}, status=409)
             except Exception as e:
                 return JsonResponse({'error': 'Invalid request'}, status=400)
 
+def archived_message_rows(conversation_id, user):
+    """
+    Reads the messages of an archived conversation in the shape get_messages builds from the table.
+
+    Args:
+        conversation_id (int): The archived conversation.
+        user (User): Whose own reactions to return.
+
+    Returns:
+        tuple: The active message rows, the variant rows, the reaction counts and the user's reactions.
+    """
+    archived = load_archived_messages(conversation_id)
+    messages = [
+        dict(msg, html=archived_message_html(msg) if msg['sender'] == 'bot' else '', timestamp=format_timestamp(msg['timestamp']))
+        for msg in archived if msg.get('is_active', True)
+    ]
+    variant_rows = sorted((msg for msg in archived if msg['sender'] == 'bot' and msg.get('parent_id')), key=lambda msg: msg['id'])
+    reaction_counts, user_reactions = {}, {}
+    for msg in messages:
+        counts = reaction_counts[msg['id']] = {'up': 0, 'down': 0}
+        for user_id, reaction, _ in msg['reactions']:
+            counts[reaction] += 1
+            if user_id == user.id:
+                user_reactions[msg['id']] = reaction
+    return messages, variant_rows, reaction_counts, user_reactions
+
+def restore_archived_message(user, message_id):
+    """Restores the archived conversation that holds a message, so the message can be changed."""
+    try:
+        message_id = int(message_id)
+    except (TypeError, ValueError):
+        return
+    if not Message.objects.filter(id=message_id).exists():
+        conversation = archived_conversation_of_message(user, message_id)
+        if conversation is not None:
+            restore_conversation(conversation)
+
+@gzip_large
 @login_required
+@use_replica
+@cache_control(private=True, no_cache=True)
+@etag(messages_etag)
 def get_messages(request):
     """
     Retrieves all messages for a given conversation.
 
+    Bot messages include their HTML, rendered once and stored on the message.
+    Rows are read with values() and reactions are counted in bulk, so no model
+    instances are built. Archived conversations are read from their archive,
+    they are only restored when something is written to them.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
@@ -389,19 +678,41 @@ def get_messages(request):
     """
     conversation_id = request.GET.get('conversation_id')
     conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-    messages = conversation.messages.order_by('timestamp')
-    messages_data = [{
-        'id': msg.id,
-        'sender': msg.sender,
-        'text': msg.text,
-        'image_url': msg.image.url if msg.image else None,
-        'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-        'reaction_counts': msg.reaction_counts,
-        'user_reaction': msg.reactions.filter(user=request.user).values_list('reaction', flat=True).first()
-    } for msg in messages]
-    return JsonResponse({'messages': messages_data, 'summary': conversation.summary})
+    if conversation.archived:
+        messages, variant_rows, reaction_counts, user_reactions = archived_message_rows(conversation.id, request.user)
+    else:
+        messages = list(conversation.messages.filter(is_active=True).order_by('timestamp').values(
+            'id', 'sender', 'text', 'html', 'html_version', 'image', 'timestamp', 'parent_id'))
+        ensure_rendered_rows(messages)
+        format_timestamps(messages)
+        variant_rows = conversation.messages.filter(sender='bot', parent__isnull=False).order_by('id').values('id', 'parent_id', 'text')
+        reaction_counts, user_reactions = reaction_summary([msg['id'] for msg in messages], request.user)
+    variants = {}
+    for variant in variant_rows:
+        variants.setdefault(variant['parent_id'], []).append({'id': variant['id'], 'text': variant['text']})
+    messages_data = []
+    for msg in messages:
+        is_bot = msg['sender'] == 'bot'
+        msg_variants = variants.get(msg['parent_id'], []) if is_bot else []
+        messages_data.append({
+            'id': msg['id'],
+            'sender': msg['sender'],
+            'text': msg['text'],
+            'html': msg['html'] if is_bot else '',
+            'image_url': media_url(msg['image']),
+            'timestamp': msg['timestamp'],
+            'reaction_counts': reaction_counts[msg['id']],
+            'user_reaction': user_reactions.get(msg['id']),
+            'variants': msg_variants,
+            'variant_index': next((i for i, v in enumerate(msg_variants) if v['id'] == msg['id']), 0),
+        })
+    return FastJsonResponse({'messages': messages_data, 'summary': conversation.summary})
 
+@gzip_large
 @login_required
+@use_replica
+@cache_control(private=True, no_cache=True)
+@etag(conversations_etag)
 def get_conversations(request):
     """
     Retrieves all conversations for the logged-in user.
@@ -412,16 +723,7 @@ def get_conversations(request):
     Returns:
         JsonResponse: Contains a list of conversations.
     """
-    conversations = Conversation.objects.filter(user=request.user).order_by('-created_at')
-    conversations_data = [
-        {
-            'id': conv.id,
-            'uuid': str(conv.uuid),
-            'created_at': conv.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'summary': conv.summary,
-        } for conv in conversations
-    ]
-    return JsonResponse({'conversations': conversations_data})
+    return FastJsonResponse({'conversations': get_user_conversations(request.user)})
 
 @login_required
 def delete_conversation(request):
@@ -439,7 +741,7 @@ def delete_conversation(request):
             data = json.loads(request.body)
             conversation_id = data.get('conversation_id')
             conversation = Conversation.objects.get(id=conversation_id, user=request.user)
-            conversation.delete()
+            delete_conversations(request.user.id, [conversation.id])
             return JsonResponse({'status': 'success'})
         except Conversation.DoesNotExist:
             return JsonResponse({'error': 'Conversation not found'}, status=404)
@@ -453,6 +755,10 @@ def delete_all_conversations(request):
     """
     Deletes all conversations for the logged-in user.
 
+    The deletion runs as a background job in bounded batches, the request
+    returns as soon as it is scheduled. Only conversations that exist when the
+    request arrives are deleted, chats started afterwards are kept.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
@@ -461,7 +767,9 @@ def delete_all_conversations(request):
     """
     if request.method == 'POST':
         try:
-            Conversation.objects.filter(user=request.user).delete()
+            max_id = Conversation.objects.filter(user=request.user).aggregate(Max('id'))['id__max']
+            if max_id is not None:
+                run_in_background(delete_conversations, request.user.id, max_id=max_id)
             return JsonResponse({'status': 'success'})
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
@@ -472,6 +780,9 @@ def delete_user_account(request):
     """
     Deletes the user's account along with all associated conversations.
 
+    The account is deactivated and logged out right away, the data is removed
+    by a background job.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
@@ -480,54 +791,124 @@ def delete_user_account(request):
     """
     if request.method == "POST":
         try:
-            Conversation.objects.filter(user=request.user).delete()
-            request.user.delete()
-            return redirect('login')           
+            user = request.user
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            logout(request)
+            run_in_background(delete_user, user.id)
+            return redirect('login')
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+@gzip_large
 @login_required
+@use_replica
 @rate_limit("export_all_conversations", limit=1, period=3600)
 def export_all_conversations(request):
     """
     Exports all conversations of the user in JSON format.
 
+    Messages of all live conversations are read in one streamed values() query.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
         JsonResponse: JSON file containing all conversations.
     """
-    conversations = Conversation.objects.filter(user=request.user).order_by('-created_at')
-    if conversations.count() == 0:
+    conversations = list(Conversation.objects.filter(user=request.user).order_by('-created_at').values_list('id', 'created_at', 'archived'))
+    if not conversations:
         return JsonResponse({'error': 'No conversations found'}, status=404)
+    live_messages = {}
+    rows = Message.objects.filter(
+        conversation_id__in=[conv_id for conv_id, _, archived in conversations if not archived], is_active=True,
+    ).order_by('conversation_id', 'timestamp').values_list('conversation_id', 'sender', 'text', 'timestamp')
+    for conv_id, sender, text, timestamp in rows.iterator(chunk_size=2000):
+        live_messages.setdefault(conv_id, []).append({'sender': sender, 'text': text, 'timestamp': format_timestamp(timestamp)})
     data = []
-    for conv in conversations:
-        messages = conv.messages.order_by('timestamp')
-        messages_data = [{'sender': msg.sender, 'text': msg.text, 'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')} for msg in messages]
+    for conv_id, created_at, archived in conversations:
+        if archived:
+            messages_data = [
+                {'sender': msg['sender'], 'text': msg['text'], 'timestamp': format_timestamp(msg['timestamp'])}
+                for msg in load_archived_messages(conv_id) if msg.get('is_active', True)
+            ]
+        else:
+            messages_data = live_messages.get(conv_id, [])
         data.append({
-            'conversation_id': conv.id,
-            'created_at': conv.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'conversation_id': conv_id,
+            'created_at': format_timestamp(created_at),
             'messages': messages_data
         })
-    response = JsonResponse({'conversations': data})
+    response = FastJsonResponse({'conversations': data})
     response['Content-Disposition'] = 'attachment; filename="conversations.json"'
     return response
 
 @login_required
+@rate_limit("import_all_conversations", limit=2, period=3600)
+def import_all_conversations(request):
+    """
+    Starts a background import of an uploaded conversations file.
+
+    Accepts the export_all_conversations JSON format or NDJSON. Summaries of
+    the imported conversations are generated after the import finishes.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: Contains the import job ID.
+    """
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            return JsonResponse({'error': 'No file uploaded'}, status=400)
+        if upload.size > settings.IMPORT_MAX_UPLOAD_SIZE:
+            return JsonResponse({'error': 'The file is too large to import.'}, status=400)
+        source = import_storage.save(f'{request.user.id}/{uuid.uuid4().hex}.json', upload)
+        job = ImportJob.objects.create(user=request.user, source=source)
+        run_in_background(run_import_job, job.id)
+        return JsonResponse({'status': 'success', 'job_id': job.id})
+    return JsonResponse({'error': 'Invalid request'}, status=400)
+
+@require_GET
+@login_required
+def get_import_status(request):
+    """
+    Reports the progress of an import job.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: Contains the job status and the number of imported conversations and messages.
+    """
+    job = get_object_or_404(ImportJob, id=request.GET.get('job_id'), user=request.user)
+    return JsonResponse({
+        'status': job.status,
+        'imported_conversations': job.imported_conversations,
+        'imported_messages': job.imported_messages,
+        'error': job.error,
+    })
+
+@login_required
+@idempotent('generate_image')
 def generate_image(request):
     """
     Generates an image based on a user-provided prompt.
 
+    Retries that carry the same Idempotency-Key get the first response back.
+    An optional integer "seed" fixes the generation, -1 (the default) picks a
+    random one. Cached generations are reused according to IMAGE_CACHE_POLICY.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
         JsonResponse: URL of the generated image or error message.
     """
-    credits = Credits.objects.get(user=request.user)
-    if credits.credits < 5:
+    context = request.user_context
+    if context.credits < IMAGE_CREDITS:
         return JsonResponse({'error': 'You need to have atleast 5 credits.'}, status=400)
     else:
         if request.method == 'POST':
@@ -535,37 +916,47 @@ def generate_image(request):
                 data = json.loads(request.body)
                 prompt = data.get('prompt')
                 conversation_id = data.get('conversation_id')
+                seed = data.get('seed', -1)
 
                 if not prompt:
                     return JsonResponse({'error': 'Prompt cannot be empty'}, status=400)
+                if not isinstance(seed, int) or isinstance(seed, bool) or seed < -1:
+                    return JsonResponse({'error': 'Seed must be a non-negative integer or -1 for a random one.'}, status=400)
 
                 if conversation_id and conversation_id != 'null':
                     conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+                    if conversation.archived:
+                        restore_conversation(conversation)
                 else:
                     conversation = Conversation.objects.create(user=request.user)
 
-                Message.objects.create(conversation=conversation, sender='user', text=prompt)
-                image = generate_image_from_prompt(prompt)
-
-                if image:
-                    unique_filename = f"generated_{uuid.uuid4().hex}.png"
-                    image_content = ContentFile(image, unique_filename)
-                    bot_message = Message.objects.create(conversation=conversation, sender='bot')
-                    bot_message.image.save(unique_filename, image_content)
-                    credits.credits -= 5
-                    credits.save()
-                    return JsonResponse({'image_url': bot_message.image.url, 'conversation_id': conversation.id})
-                else:
-                    return JsonResponse({'error': 'Failed to generate image.'}, status=500)
+                with conversation_lock(conversation.id):
+                    Message.objects.create(conversation=conversation, sender='user', text=prompt)
+                    image_name = generated_image_name(prompt, dict(DEFAULT_PARAMS, seed=seed))
 
+                    if image_name:
+                        bot_message = Message.objects.create(conversation=conversation, sender='bot', image=image_name)
+                        context.charge(IMAGE_CREDITS)
+                        return JsonResponse({'image_url': bot_message.image.url, 'conversation_id': conversation.id})
+                    else:
+                        return JsonResponse({'error': 'Failed to generate image.'}, status=500)
+
+            except LockTimeout:
+                return JsonResponse({'error': 'This conversation is busy with another message.'}, status=409)
             except Exception as e:
                 return JsonResponse({'error': str(e)}, status=500)
         return JsonResponse({'error': 'Invalid request'}, status=400)
 
+@require_GET
+@cache_control(public=True, max_age=settings.PUBLIC_PAGE_MAX_AGE, s_maxage=settings.PUBLIC_PAGE_SHARED_MAX_AGE)
+@etag(public_conversation_etag)
 def public_conversation_view(request, uuid):
     """
     Displays a public view of a conversation based on its UUID.
 
+    The page is rendered once per conversation version and served from the cache,
+    with ETag and Cache-Control headers so reverse proxies and CDNs can keep it.
+
     Args:
         request (HttpRequest): The HTTP request object.
         uuid (str): The UUID of the conversation.
@@ -573,17 +964,38 @@ def public_conversation_view(request, uuid):
     Returns:
         HttpResponse: Rendered public conversation page.
     """
-    conversation = get_object_or_404(Conversation, uuid=uuid)
-    messages = conversation.messages.order_by('timestamp')
-    messages_data = [
-        {
-            'sender': msg.sender,
-            'text': msg.text,
-            'image_url': msg.image.url if msg.image else None,
-            'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        } for msg in messages
-    ]
-    return render(request, 'public_conversation.html', {'messages': messages_data})
+    conversation_id = get_public_conversation_id(uuid)
+    if conversation_id is None:
+        raise Http404('Conversation not found')
+    cache_key = f"public_conversation:{uuid}:{get_version('conversation', conversation_id)}"
+    html = cache.get(cache_key)
+    if html is None:
+        conversation = get_object_or_404(Conversation, uuid=uuid)
+        if conversation.archived:
+            messages_data = [
+                {
+                    'sender': msg['sender'],
+                    'text': msg['text'],
+                    'html': archived_message_html(msg) if msg['sender'] == 'bot' else '',
+                    'image_url': msg['image_url'],
+                    'timestamp': msg['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+                } for msg in load_archived_messages(conversation.id) if msg.get('is_active', True)
+            ]
+        else:
+            messages = list(conversation.messages.filter(is_active=True).order_by('timestamp'))
+            ensure_rendered(messages)
+            messages_data = [
+                {
+                    'sender': msg.sender,
+                    'text': msg.text,
+                    'html': msg.html,
+                    'image_url': msg.image.url if msg.image else None,
+                    'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                } for msg in messages
+            ]
+        html = render_to_string('public_conversation.html', {'messages': messages_data})
+        cache.set(cache_key, html, settings.PUBLIC_PAGE_CACHE_TIMEOUT)
+    return HttpResponse(html)
 
 def register(request):
     """
@@ -598,11 +1010,8 @@ def register(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            form.save()
-            username = form.cleaned_data.get('username')
-            raw_password = form.cleaned_data.get('password1')
-            user = authenticate(username=username, password=raw_password)
-            login(request, user)
+            user = form.save()
+            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'status': 'success', 'redirect_url': reverse('chat')})
             return redirect('chat')
@@ -645,19 +1054,46 @@ def custom_login(request):
 
 @require_GET
 @login_required
+@use_replica
+@cache_control(private=True, no_cache=True)
+@etag(prompts_etag)
 def get_prompts(request):
     """
-    Retrieve all useful prompts from the database and return them as a JSON response.
+    Search the useful prompts library and return the best matches as a JSON response.
+
+    Args:
+        request (HttpRequest): The HTTP request object, with an optional `q` search
+            query and `limit` on the number of results.
+
+    Returns:
+        JsonResponse: A JSON object containing a list of prompts with their id, name and explanation.
+            The prompt content is fetched separately through get_prompt_content.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', settings.PROMPT_SEARCH_LIMIT)), settings.PROMPT_SEARCH_LIMIT))
+    except ValueError:
+        limit = settings.PROMPT_SEARCH_LIMIT
+    return JsonResponse({'prompts': get_prompt_index().search(query, limit)})
+
+@require_GET
+@login_required
+def get_prompt_content(request):
+    """
+    Retrieve the content of a single prompt.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        JsonResponse: A JSON object containing a list of prompts with their id, name, content, and explanation.
+        JsonResponse: A JSON object containing the prompt id and content.
     """
-    prompts = Prompt.objects.all().values('id', 'name', 'content', 'explanation')
-    prompts_list = list(prompts)
-    return JsonResponse({'prompts': prompts_list})
+    try:
+        prompt_id = int(request.GET.get('prompt_id', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid prompt id'}, status=400)
+    prompt = get_object_or_404(Prompt.objects.only('id', 'content'), id=prompt_id)
+    return JsonResponse({'id': prompt.id, 'content': prompt.content})
 
 
 
@@ -693,25 +1129,19 @@ def profile_view(request):
 
             backend_api_form = BackendAPIChoiceForm(request.POST, instance=profile)
             if backend_api_form.is_valid():
-                backend_api_form.save()
+                warm_selected_model(backend_api_form.save())
                 messages.success(request, 'Backend API updated successfully.')
                 return redirect('profile')
                  
         elif 'enable_2fa' in request.POST:
             profile.generate_otp_secret_key()
-            totp = pyotp.TOTP(profile.otp_secret_key)
-            otp_auth_url = totp.provisioning_uri(name=request.user.username, issuer_name="DjangoAI")
-            qr = qrcode.make(otp_auth_url)
-            buffered = BytesIO()
-            qr.save(buffered, format="PNG")
-            qr_code_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+            qr_code_base64 = otp_qr_code_base64(request.user.username, profile.otp_secret_key)
             return JsonResponse({'status': 'qr_generated', 'qr_code_base64': qr_code_base64})
         elif 'confirm_enable_2fa' in request.POST:
             otp_form = OTPEnableForm(request.POST)
             if otp_form.is_valid():
                 otp_token = otp_form.cleaned_data.get('otp_token')
-                totp = pyotp.TOTP(profile.otp_secret_key)
-                if totp.verify(otp_token):
+                if profile.verify_otp(otp_token):
                     profile.otp_enabled = True
                     profile.save()
                     messages.success(request, 'Two-Factor Authentication has been enabled.')
@@ -726,8 +1156,7 @@ def profile_view(request):
             otp_form = OTPEnableForm(request.POST)
             if otp_form.is_valid():
                 otp_token = otp_form.cleaned_data.get('otp_token')
-                totp = pyotp.TOTP(profile.otp_secret_key)
-                if totp.verify(otp_token):
+                if profile.verify_otp(otp_token):
                     profile.otp_enabled = False
                     profile.otp_secret_key = ''
                     profile.save()
@@ -749,34 +1178,59 @@ def regenerate_response(request):
     """
     Regenerates the last assistant response in a conversation.
 
+    Generates settings.REGENERATE_CANDIDATES answers in parallel and stores
+    them as variants of the turn next to the earlier ones. The first new
+    answer becomes the active variant, the others can be picked with
+    select_variant without calling the backend again. If every backend
+    fails, the turn is left unchanged and the error is returned.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        JsonResponse: Contains the new assistant's response.
+        JsonResponse: Contains the new assistant's response and all variants of the turn.
     """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             conversation_id = data.get('conversation_id')
             conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-            last_bot_message = conversation.messages.filter(sender='bot').last()
-            if last_bot_message:
-                last_bot_message.delete()
-            last_user_message = conversation.messages.filter(sender='user').last()
+            if conversation.archived:
+                restore_conversation(conversation)
+            last_user_message = conversation.messages.filter(sender='user', is_active=True).last()
             if not last_user_message:
                 return JsonResponse({'error': 'No user message found to regenerate from'}, status=400)
-            credits = Credits.objects.get(user=request.user)
-            if credits.credits <= 0:
+            context = request.user_context
+            if context.credits <= 0:
                 return JsonResponse({'error': 'You have no credits left. Please buy more credits to continue.'}, status=400)
 
-            backend_api = request.user.profile.backend_api_choice
-            response_text = send_to_backend(conversation, credits, backend_api)
-            new_bot_message = Message.objects.create(conversation=conversation, sender='bot', text=response_text)
+            credits_before = context.credits
+            texts, route = generate_candidates(conversation, context, settings.REGENERATE_CANDIDATES)
+            if texts[0].startswith('Error'):
+                # Every backend failed, the turn keeps its current answer.
+                return JsonResponse({'error': texts[0]}, status=502)
+            with transaction.atomic():
+                turn = conversation.messages.filter(sender='bot', id__gt=last_user_message.id)
+                # Answers stored before variants existed have no parent yet.
+                turn.filter(parent__isnull=True).update(parent=last_user_message)
+                turn.update(is_active=False)
+                new_messages = [
+                    Message.objects.create(conversation=conversation, sender='bot', text=text,
+                                           parent=last_user_message, is_active=(i == 0), **route,
+                                           **rendered_fields(text))
+                    for i, text in enumerate(texts)
+                ]
+            schedule_indexing(request.user.id)
+            variants = list(last_user_message.variants.order_by('id').values('id', 'text'))
+            active = new_messages[0]
             return JsonResponse({
-                'response': response_text,
-                'message_id': new_bot_message.id,
-                'reaction_counts': new_bot_message.reaction_counts,
+                'response': active.text,
+                'html': active.html,
+                'message_id': active.id,
+                'variants': variants,
+                'variant_index': next(i for i, v in enumerate(variants) if v['id'] == active.id),
+                'credits_used': credits_before - context.credits,
+                'reaction_counts': active.reaction_counts,
                 'user_reaction': None
             })
         except Exception as e:
@@ -784,6 +1238,42 @@ def regenerate_response(request):
 
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+@login_required
+def select_variant(request):
+    """
+    Makes another stored variant of an assistant turn the active one.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: Contains the selected variant.
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            restore_archived_message(request.user, data.get('message_id'))
+            message = get_object_or_404(Message, id=data.get('message_id'), sender='bot',
+                                        parent__isnull=False, conversation__user=request.user)
+            with transaction.atomic():
+                Message.objects.filter(parent_id=message.parent_id).exclude(id=message.id).update(is_active=False)
+                Message.objects.filter(id=message.id).update(is_active=True)
+            bump_version('conversation', message.conversation_id)
+            ensure_rendered([message])
+            return JsonResponse({
+                'response': message.text,
+                'html': message.html,
+                'message_id': message.id,
+                'reaction_counts': message.reaction_counts,
+                'user_reaction': message.reactions.filter(user=request.user).values_list('reaction', flat=True).first()
+            })
+        except Http404:
+            raise
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({'error': 'Invalid request'}, status=400)
+
 @rate_limit("toggle_reaction", limit=10, period=15)
 @login_required
 def toggle_reaction(request):
@@ -803,6 +1293,7 @@ def toggle_reaction(request):
             reaction_type = data.get('reaction')
             if reaction_type not in ['up', 'down']:
                 return JsonResponse({'error': 'Invalid reaction type'}, status=400)
+            restore_archived_message(request.user, message_id)
             message = get_object_or_404(Message, id=message_id)
             
             if message.sender != 'bot':
@@ -813,17 +1304,20 @@ def toggle_reaction(request):
             ).first()
             
             if existing_reaction:
+                record_reaction_event(message, request.user.id, existing_reaction.reaction, -1)
                 if existing_reaction.reaction == reaction_type:
                     existing_reaction.delete()
                 else:
                     existing_reaction.reaction = reaction_type
                     existing_reaction.save()
+                    record_reaction_event(message, request.user.id, reaction_type, 1)
             else:
                 MessageReaction.objects.create(
                     message=message,
                     user=request.user,
                     reaction=reaction_type
                 )
+                record_reaction_event(message, request.user.id, reaction_type, 1)
             return JsonResponse({
                 'reaction_counts': message.reaction_counts,
                 'status': 'success'
@@ -834,49 +1328,94 @@ def toggle_reaction(request):
             
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+@gzip_large
 @login_required
+@use_replica
 def search_conversations(request):
     """
     Search through user's conversations and messages.
-    Returns conversations that match the search query in messages or summary.
+
+    Keyword matches in messages or summary and semantic matches from the
+    user's vector index are merged with reciprocal rank fusion, so
+    conversations found both ways come first. The `mode` parameter is
+    "keyword", "semantic" or "hybrid" (the default).
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        JsonResponse: Contains the search result conversations.
+        JsonResponse: Contains the search result conversations, best match first.
     """
     query = request.GET.get('q', '').strip()
     if not query:
         return JsonResponse({'results': []})
-    
-    conversations = Conversation.objects.filter(
-        user=request.user
-    ).filter(
-        Q(messages__text__icontains=query) | Q(summary__icontains=query)      
-    ).distinct()
-    
+    mode = request.GET.get('mode', 'hybrid')
+    if mode not in ('keyword', 'semantic', 'hybrid'):
+        mode = 'hybrid'
+    if not settings.SEMANTIC_SEARCH:
+        mode = 'keyword'
+
+    keyword_ids, archived_matches = [], {}
+    if mode != 'semantic':
+        keyword_ids = list(Conversation.objects.filter(user=request.user).filter(
+            Q(messages__text__icontains=query) | Q(summary__icontains=query)
+        ).order_by('-created_at').values_list('id', flat=True).distinct())
+        for conv, matching in search_archived_conversations(request.user, query, keyword_ids):
+            keyword_ids.append(conv.id)
+            archived_matches[conv.id] = matching
+
+    semantic_hits = {}
+    if mode != 'keyword':
+        try:
+            semantic_hits = {conv_id: message_ids for conv_id, _, message_ids in semantic_search(request.user.id, query)}
+        except Exception as e:
+            print(f"Error in semantic search: {e}")
+        schedule_indexing(request.user.id)
+
+    scores = {}
+    for ranking in (keyword_ids, list(semantic_hits)):
+        for rank, conv_id in enumerate(ranking, start=1):
+            scores[conv_id] = scores.get(conv_id, 0) + 1 / (SEARCH_RRF_K + rank)
+    conversations = sorted(Conversation.objects.filter(user=request.user, id__in=scores).values('id', 'summary', 'created_at', 'archived'),
+                           key=lambda conv: -scores[conv['id']])
+
+    keyword_set = set(keyword_ids)
+    semantic_messages = {msg['id']: msg for msg in Message.objects.filter(id__in=[
+        message_id for conv in conversations if not conv['archived'] and conv['id'] not in keyword_set
+        for message_id in semantic_hits.get(conv['id'], [])
+    ], is_active=True).values('id', 'text', 'sender', 'timestamp')}
     results = []
     for conv in conversations:
-        matching_messages = conv.messages.filter(
-            text__icontains=query
-        ).order_by('timestamp')[:3]
-        
+        if conv['archived']:
+            if conv['id'] in archived_matches:
+                matching = archived_matches[conv['id']]
+            else:
+                ids = set(semantic_hits.get(conv['id'], []))
+                matching = [msg for msg in load_archived_messages(conv['id']) if msg['id'] in ids]
+            matching_messages = matching[:3]
+        elif conv['id'] in keyword_set:
+            matching_messages = Message.objects.filter(
+                conversation_id=conv['id'], text__icontains=query
+            ).order_by('timestamp').values('text', 'sender', 'timestamp')[:3]
+        else:
+            matching_messages = [semantic_messages[message_id] for message_id in semantic_hits[conv['id']]
+                                 if message_id in semantic_messages]
+
         results.append({
-            'id': conv.id,
-            'summary': conv.summary or 'No summary available',
-            'created_at': conv.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'id': conv['id'],
+            'summary': conv['summary'] or 'No summary available',
+            'created_at': format_timestamp(conv['created_at']),
             'matching_messages': [
                 {
-                    'text': msg.text,
-                    'sender': msg.sender,
-                    'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                    'text': msg['text'],
+                    'sender': msg['sender'],
+                    'timestamp': format_timestamp(msg['timestamp'])
                 }
                 for msg in matching_messages
             ]
         })
     
-    return JsonResponse({'results': results})
+    return FastJsonResponse({'results': results})
 
 @login_required
 def get_message_id(request):
@@ -891,8 +1430,35 @@ def get_message_id(request):
     """
     conversation_id = request.GET.get('conversation_id')
     conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-    last_bot_message = conversation.messages.filter(sender='bot').last()
+    last_bot_message = conversation.messages.filter(sender='bot', is_active=True).last()
     if last_bot_message:
         return JsonResponse({'message_id': last_bot_message.id})
     else:
-        return JsonResponse({'error': 'No bot message found'}, status=404)
\ No newline at end of file
+        return JsonResponse({'error': 'No bot message found'}, status=404)
+
+@require_GET
+@login_required
+@cache_control(private=True, max_age=60)
+def get_usage_report(request):
+    """
+    Reports usage and reactions per backend and model from the usage rollups.
+
+    Staff see all users, everyone else their own usage. The live message and
+    reaction tables are never queried.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: Contains one row per backend/model for the last ?days= days (7 by default).
+    """
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 366)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid number of days'}, status=400)
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = usage_report(since, user=None if request.user.is_staff else request.user)
+    for row in rows:
+        total = row['reactions_up'] + row['reactions_down']
+        row['helpful_ratio'] = row['reactions_up'] / total if total else None
+    return JsonResponse({'since': since.isoformat(), 'usage': rows})
@@ -0,0 +1,107 @@
+# chat/warmup.py
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.dispatch import receiver
+
+from .models import Profile
+from .tasks import run_in_background
+
+__all__ = ['ollama_base_url', 'warm_ollama_model', 'keep_model_alive', 'warm_selected_model']
+
+
+def ollama_base_url():
+    """Returns the OLLAMA_URL setting without surrounding whitespace or a trailing slash."""
+    return (settings.OLLAMA_URL or 'http://localhost:11434').strip().rstrip('/')
+
+def warm_ollama_model(model):
+    """
+    Loads an Ollama model and keeps it in memory for OLLAMA_KEEP_ALIVE.
+
+    A generate request without a prompt only loads the model, so this is
+    cheap when the model is already resident and just extends its lifetime.
+
+    Args:
+        model (str): The Ollama model name.
+
+    Returns:
+        bool: True if Ollama accepted the request.
+    """
+    import requests
+
+    try:
+        response = requests.post(
+            f"{ollama_base_url()}/api/generate",
+            json={'model': model, 'keep_alive': settings.OLLAMA_KEEP_ALIVE},
+            timeout=settings.OLLAMA_WARM_TIMEOUT,
+        )
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error warming Ollama model {model}: {e}")
+        return False
+
+def _hint_timeout():
+    """How long the keep-alive markers live, a little longer than one hint may take."""
+    return int(settings.OLLAMA_WARM_TIMEOUT) + 60
+
+def _keep_alive_keys(model):
+    return f'ollama_keepalive_pending:{model}', f'ollama_keepalive_running:{model}'
+
+def _send_keep_alive(model):
+    """Sends keep_alive hints until no answer of the model is left without one after it."""
+    pending, running = _keep_alive_keys(model)
+    while True:
+        # Refreshed per hint, so a worker that died holding it only blocks hints until it expires.
+        cache.set(running, True, _hint_timeout())
+        cache.delete(pending)
+        warm_ollama_model(model)
+        if cache.get(pending) is not None:
+            continue
+        cache.delete(running)
+        # An answer that finished just before the delete found the hint still running.
+        if cache.get(pending) is None or not cache.add(running, True, _hint_timeout()):
+            return
+
+def keep_model_alive(model):
+    """
+    Sends a keep_alive hint for a model that just answered a request.
+
+    Requests through the OpenAI-compatible endpoint reset the model to the
+    server's default keep-alive, so every answer needs a hint after it. One
+    hint per model is in flight at a time: answers that finish meanwhile mark
+    the model pending and the running hint is sent again once it is done, so
+    busy chat traffic does not fill the shared background pool.
+
+    Args:
+        model (str): The Ollama model name.
+    """
+    pending, running = _keep_alive_keys(model)
+    cache.set(pending, True, _hint_timeout())
+    if cache.add(running, True, _hint_timeout()):
+        run_in_background(_send_keep_alive, model)
+
+def warm_selected_model(profile):
+    """
+    Pre-warms the profile's Ollama model in the background.
+
+    Warm-ups of the same model are throttled to one per OLLAMA_PREWARM_INTERVAL,
+    so repeated logins and profile saves do not queue up load requests.
+
+    Args:
+        profile (Profile): The user's profile.
+    """
+    if profile.backend_api_choice != 'ollama' or not profile.selected_ollama_model_id:
+        return
+    model = profile.selected_ollama_model.name
+    if cache.add(f'ollama_prewarm:{model}', True, settings.OLLAMA_PREWARM_INTERVAL):
+        run_in_background(warm_ollama_model, model)
+
+
+@receiver(user_logged_in)
+def warm_model_on_login(sender, request, user, **kwargs):
+    """Starts loading the user's Ollama model while the chat page renders."""
+    try:
+        warm_selected_model(Profile.objects.select_related('selected_ollama_model').get(user=user))
+    except Exception as e:
+        print(f"Error scheduling model warm-up: {e}")
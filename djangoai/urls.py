@@ -3,11 +3,13 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from chat.serving import serve_media, serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name='media'),
     path('', include('chat.urls')),
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if settings.SERVE_STATIC:
+    urlpatterns.insert(0, path(f"{settings.STATIC_URL.strip('/')}/<path:path>", serve_static, name='static'))